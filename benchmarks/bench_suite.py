@@ -0,0 +1,138 @@
+# 解析与生成各阶段的耗时和内存峰值基准:
+#     python benchmarks/bench_suite.py --sizes 1000,10000,100000 --output results.json
+#     python benchmarks/bench_suite.py --compare results.json --threshold 1.25
+import argparse, gc, json, os, platform, sys, tempfile, time, tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from synthetic import write_exchange_out
+from t2s.builder import build_sunny_julia
+from t2s.core.atom_parser import parse_magnetic_atoms
+from t2s.core.bond_table import BondTable, np
+from t2s.core.exchange_out import load_exchange_out
+from t2s.core.exchange_parser import parse_exchange_blocks
+from t2s.core.lattice_reader import read_lattice_vectors
+from t2s.core.symmetry import group_exchange_shells
+from t2s.generators.exchange_generator import make_sunny_exchange_block
+
+RESULT_FORMAT = 1
+
+def stages(path, spins):
+    # 每个阶段的输入在计时之外准备好
+    yield "read_lattice_vectors", lambda: None, lambda _: read_lattice_vectors(path)
+    yield "parse_magnetic_atoms", lambda: None, lambda _: parse_magnetic_atoms(path)
+    yield "parse_exchange_blocks", lambda: None, lambda _: parse_exchange_blocks(path)
+    yield ("group_exchange_shells",
+           lambda: BondTable.from_bonds(parse_exchange_blocks(path)),
+           group_exchange_shells)
+    yield ("make_sunny_exchange_block",
+           lambda: load_exchange_out(path),
+           lambda model: make_sunny_exchange_block(model, use_dmi=model.is_soc, spins=spins))
+    yield "build_sunny_julia", lambda: None, lambda _: build_sunny_julia(path, spins=spins)
+
+def measure(setup, run, repeat):
+    arg = setup()
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        run(arg)
+        best = min(best, time.perf_counter() - t0)
+
+    # tracemalloc 会拖慢执行, 峰值内存单独跑一次
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+def run_suite(sizes, n_atoms, n_shells, soc, repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_bonds in sizes:
+            path = os.path.join(tmp, f"exchange_{n_bonds}.out")
+            written, magnetic = write_exchange_out(path, n_atoms=n_atoms, n_shells=n_shells,
+                                                   n_bonds=n_bonds, soc=soc)
+            spins = ["1"] * len(magnetic)
+            entry = {
+                "bonds": written,
+                "atoms": n_atoms,
+                "shells": n_shells,
+                "soc": soc,
+                "file_mb": os.path.getsize(path) / 2**20,
+                "stages": {},
+            }
+            for name, setup, run in stages(path, spins):
+                seconds, peak = measure(setup, run, repeat)
+                entry["stages"][name] = {"seconds": seconds, "peak_mb": peak / 2**20}
+                print(f"{written:>9d} bonds  {name:<26s} {seconds:9.4f} s  "
+                      f"{peak / 2**20:9.1f} MB peak", file=sys.stderr)
+            results.append(entry)
+    return results
+
+def environment():
+    return {
+        "format": RESULT_FORMAT,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "numpy": np.__version__ if np is not None else None,
+    }
+
+def compare(current, baseline, threshold):
+    # 按 (键数, 原子数, 壳层数, SOC, 阶段) 对齐, 比值超过 threshold 视为回归
+    def index(results):
+        return {(e["bonds"], e["atoms"], e["shells"], e["soc"], name): stage
+                for e in results for name, stage in e["stages"].items()}
+
+    old = index(baseline["results"])
+    regressions = []
+    for key, stage in sorted(index(current["results"]).items()):
+        ref = old.get(key)
+        if ref is None or ref["seconds"] <= 0:
+            continue
+        ratio = stage["seconds"] / ref["seconds"]
+        flag = "REGRESSION" if ratio > threshold else ""
+        print(f"{key[0]:>9d} bonds  {key[4]:<26s} {ratio:6.2f}x  {flag}", file=sys.stderr)
+        if ratio > threshold:
+            regressions.append(key)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="逗号分隔的键数列表")
+    parser.add_argument("--atoms", type=int, default=4)
+    parser.add_argument("--shells", type=int, default=6)
+    parser.add_argument("--collinear", action="store_true")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="把结果写成 JSON")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果比较")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="耗时比值超过该值时报告回归并以非零状态退出")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    report = dict(environment(), results=run_suite(sizes, args.atoms, args.shells,
+                                                    not args.collinear, args.repeat))
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
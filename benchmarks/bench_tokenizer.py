@@ -0,0 +1,92 @@
+# 交换段分词器与原来的正则循环的吞吐量对比:
+#     python benchmarks/bench_tokenizer.py --bonds 200000
+import argparse, os, re, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from synthetic import write_exchange_out
+from t2s.core.exchange_parser import iter_exchange_bonds
+from t2s.core.lattice_reader import read_lines
+
+def legacy_iter_exchange_bonds(lines):
+    # 优化前的解析循环: 每行多次 strip, 未预编译的正则
+    in_exch = False
+    cur = None
+    for line in lines:
+        if line.strip().startswith("Exchange"):
+            in_exch = True
+            continue
+        if not in_exch:
+            continue
+        if line.strip().startswith("----"):
+            if cur:
+                yield cur
+                cur = None
+            continue
+        if not line.strip():
+            continue
+        if line.strip().startswith("i") and "J_iso" in line:
+            continue
+        if cur is None:
+            m = re.match(
+                r"\s*(\S+)\s+(\S+)\s+\(\s*([-\d]+),\s*([-\d]+),\s*([-\d]+)\s*\)\s+"
+                r"([-\d.]+)\s+\(\s*([-\d.]+),\s*([-\d.]+),\s*([-\d.]+)\s*\)\s+([-\d.]+)",
+                line,
+            )
+            if not m:
+                continue
+            cur = {
+                "i_label": m.group(1),
+                "j_label": m.group(2),
+                "R": (int(m.group(3)), int(m.group(4)), int(m.group(5))),
+                "J_inline": float(m.group(6)),
+                "disp": (float(m.group(7)), float(m.group(8)), float(m.group(9))),
+                "distance": float(m.group(10)),
+                "J_iso": None,
+                "DMI": (0.0, 0.0, 0.0),
+            }
+        else:
+            s = line.strip()
+            if s.startswith("J_iso:"):
+                try:
+                    cur["J_iso"] = float(s.split()[1])
+                except Exception:
+                    pass
+            elif "DMI:" in line:
+                m = re.search(r"DMI:\s*\(\s*([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s*\)", line)
+                if m:
+                    cur["DMI"] = (float(m.group(1)), float(m.group(2)), float(m.group(3)))
+    if cur:
+        yield cur
+
+def throughput(parse, lines, size, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        n = sum(1 for _ in parse(lines))
+        best = min(best, time.perf_counter() - t0)
+    return n, size / best / 2**20
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bonds", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--collinear", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "exchange.out")
+        write_exchange_out(path, n_bonds=args.bonds, soc=not args.collinear)
+        size = os.path.getsize(path)
+        lines = read_lines(path)
+
+    n_old, old = throughput(legacy_iter_exchange_bonds, lines, size, args.repeat)
+    n_new, new = throughput(iter_exchange_bonds, lines, size, args.repeat)
+    assert n_old == n_new
+    print(f"file: {size / 2**20:.1f} MB, {n_new} bonds")
+    print(f"legacy regex loop: {old:8.1f} MB/s")
+    print(f"tokenizer:         {new:8.1f} MB/s  ({new / old:.2f}x)")
+
+if __name__ == "__main__":
+    main()
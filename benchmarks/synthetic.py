@@ -0,0 +1,134 @@
+# 生成基准测试用的合成 TB2J exchange.out:
+#     python benchmarks/synthetic.py exchange.out --atoms 8 --shells 6 --bonds 100000 [--collinear]
+import argparse, itertools, math, random
+from typing import List, Tuple
+
+SEPARATOR = "=" * 90
+BOND_SEPARATOR = "-" * 88
+# 最近邻距离约为该值 (Å)
+NEIGHBOUR_DIST = 2.8
+
+def magnetic_basis(n_atoms: int, n_nonmagnetic: int = 1):
+    # 原子放在 k×k×k 网格上, 前 n_atoms 个为磁性原子 (Fe, 反铁磁交替), 其余为小磁矩的 O
+    k = max(1, math.ceil((n_atoms + n_nonmagnetic) ** (1.0 / 3.0) - 1e-9))
+    sites = list(itertools.product(range(k), repeat=3))[:n_atoms + n_nonmagnetic]
+    basis = []
+    for n, (x, y, z) in enumerate(sites):
+        frac = (x / k, y / k, z / k)
+        if n < n_atoms:
+            basis.append((f"Fe{n + 1}", frac, 2.5 if n % 2 == 0 else -2.5))
+        else:
+            basis.append((f"O{n - n_atoms + 1}", frac, 0.05))
+    a = NEIGHBOUR_DIST * k
+    cell = ((a, 0.0, 0.0), (0.0, a, 0.0), (0.0, 0.0, 1.1 * a))
+    return cell, basis
+
+def _cart(cell, f):
+    return tuple(sum(f[k] * cell[k][d] for k in range(3)) for d in range(3))
+
+def _cube_radius(n_pairs: int, n_bonds: int) -> int:
+    r = 0
+    while n_pairs * (2 * r + 1) ** 3 - n_pairs < n_bonds:
+        r += 1
+    return r
+
+def _shell_cutoff(cell, basis, n_shells: int) -> float:
+    dists = set()
+    for (_, fi, _), (_, fj, _) in itertools.product(basis, repeat=2):
+        for R in itertools.product(range(-2, 3), repeat=3):
+            d = _cart(cell, tuple(fj[k] + R[k] - fi[k] for k in range(3)))
+            dist = round(math.sqrt(sum(v * v for v in d)), 3)
+            if dist > 0:
+                dists.add(dist)
+    ordered = sorted(dists)
+    return ordered[min(n_shells, len(ordered)) - 1] if ordered else 0.0
+
+def write_exchange_out(path: str,
+                       n_atoms: int = 4,
+                       n_shells: int = 6,
+                       n_bonds: int = 10000,
+                       soc: bool = True,
+                       n_nonmagnetic: int = 1,
+                       seed: int = 0) -> Tuple[int, List[str]]:
+    # 距离在前 n_shells 个壳层内的键带有明显的 J/DMI, 更远的键只有 1e-4 量级的噪声 (与 TB2J 输出类似)
+    rnd = random.Random(seed)
+    cell, basis = magnetic_basis(n_atoms, n_nonmagnetic)
+    cutoff = _shell_cutoff(cell, basis, n_shells)
+    r = _cube_radius(len(basis) ** 2, n_bonds)
+    cube = sorted(itertools.product(range(-r, r + 1), repeat=3), key=lambda R: (max(map(abs, R)), R))
+
+    written = 0
+    with open(path, "w") as fh:
+        fh.write(f"{SEPARATOR}\nTB2J version 0.7\nInformation: synthetic benchmark input\n")
+        if soc:
+            fh.write("Calculation mode: non-collinear\n")
+        fh.write(f"\n{SEPARATOR}\nCell (Angstrom):\n")
+        for v in cell:
+            fh.write("  " + "  ".join(f"{x:9.4f}" for x in v) + "\n")
+        fh.write(f"\n{SEPARATOR}\nAtoms:  \n(Note: charge and magmoms only count the wannier functions.)\n")
+        if soc:
+            fh.write("  Atom_number     x          y          z        w_charge     M(x)      M(y)      M(z)   \n")
+        else:
+            fh.write("  Atom_number     x          y          z        w_charge     w_magmom   \n")
+        for name, frac, m in basis:
+            x, y, z = _cart(cell, frac)
+            if soc:
+                fh.write(f"   {name:6s} {x:10.4f} {y:10.4f} {z:10.4f} {6.5:10.4f} "
+                         f"{0.1 * m:10.4f} {0.0:10.4f} {m:10.4f}\n")
+            else:
+                fh.write(f"   {name:6s} {x:10.4f} {y:10.4f} {z:10.4f} {6.5:10.4f} {m:10.4f}\n")
+        fh.write(f"Total {6.5 * len(basis):42.4f}\n\n")
+        fh.write(f"{SEPARATOR}\nExchange: \n")
+        fh.write("    i      j          R        J_iso(meV)          vector          distance(A)\n")
+        fh.write(BOND_SEPARATOR + "\n")
+
+        # 按 R 由近到远写出, 截断到 n_bonds 时保留的总是最近的壳层
+        for R in cube:
+            if written >= n_bonds:
+                break
+            for (i, fi, mi), (j, fj, mj) in itertools.product(basis, repeat=2):
+                if written >= n_bonds:
+                    break
+                if i == j and not any(R):
+                    continue
+                d = _cart(cell, tuple(fj[k] + R[k] - fi[k] for k in range(3)))
+                dist = math.sqrt(sum(v * v for v in d))
+                if round(dist, 3) <= cutoff:
+                    J = -20.0 * math.exp(-dist / 1.5) * math.copysign(1.0, mi * mj)
+                    if i.startswith("O") or j.startswith("O"):
+                        J *= 0.01
+                    D = [0.1 * math.exp(-dist / 2) * v for v in (d[1], -d[0], 0.3)]
+                else:
+                    J = 1e-4 * rnd.randint(-3, 3)
+                    D = [1e-4 * rnd.randint(-3, 3) for _ in range(3)]
+                fh.write(f"   {i:5s} {j:5s} ({R[0]:3d},{R[1]:3d},{R[2]:3d}) {J:10.4f}   "
+                         f"({d[0]:7.3f},{d[1]:7.3f},{d[2]:7.3f}) {dist:7.3f}\n")
+                fh.write(f"J_iso: {J:10.4f}\n")
+                if soc:
+                    fh.write(f"[Testing!] Jprime: {J:.4f},  B: 0.0000\n")
+                    fh.write("[Testing!] DMI: (0.0000 0.0000 0.0000)\n")
+                    fh.write(f"DMI: ({D[0]:.4f} {D[1]:.4f} {D[2]:.4f})\n")
+                    fh.write("J_ani:\n[[ 0.000  0.000  0.000]\n [ 0.000  0.000  0.000]\n"
+                             " [ 0.000  0.000  0.000]]\n")
+                fh.write("\n" + BOND_SEPARATOR + "\n")
+                written += 1
+
+    return written, [name for name, _, m in basis if abs(m) >= 0.5]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("output")
+    parser.add_argument("--atoms", type=int, default=4, help="磁性原子数")
+    parser.add_argument("--nonmagnetic", type=int, default=1)
+    parser.add_argument("--shells", type=int, default=6, help="带有明显耦合的距离壳层数")
+    parser.add_argument("--bonds", type=int, default=10000)
+    parser.add_argument("--collinear", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    n, magnetic = write_exchange_out(args.output, n_atoms=args.atoms, n_shells=args.shells,
+                                     n_bonds=args.bonds, soc=not args.collinear,
+                                     n_nonmagnetic=args.nonmagnetic, seed=args.seed)
+    print(f"{args.output}: {n} bonds, magnetic atoms {', '.join(magnetic)}")
+
+if __name__ == "__main__":
+    main()
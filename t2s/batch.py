@@ -0,0 +1,108 @@
+import glob, os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .builder import write_sunny_julia_file
+from .core.lattice_reader import COMPRESSED_SUFFIXES, strip_compression_suffix
+
+DEFAULT_PATTERN = "exchange.out"
+
+def _rglob(root: Path, pattern: str) -> List[Path]:
+    # 同名的压缩文件 (exchange.out.gz 等) 也算作输入
+    paths = set()
+    for pat in (pattern,) + tuple(pattern + ext for ext in COMPRESSED_SUFFIXES):
+        paths.update(p for p in root.rglob(pat) if p.is_file())
+    return sorted(paths)
+
+def discover_inputs(sources: Iterable[str], pattern: str = DEFAULT_PATTERN) -> List[Path]:
+    found: List[Path] = []
+    seen = set()
+    for src in sources:
+        if os.path.isdir(src):
+            paths = _rglob(Path(src), pattern)
+        elif glob.has_magic(src):
+            paths = [Path(p) for p in sorted(glob.glob(src, recursive=True))]
+            expanded: List[Path] = []
+            for p in paths:
+                if p.is_dir():
+                    expanded += _rglob(p, pattern)
+                elif p.is_file():
+                    expanded.append(p)
+            paths = expanded
+        else:
+            paths = [Path(src)]
+        for p in paths:
+            key = os.path.abspath(p)
+            if key not in seen:
+                seen.add(key)
+                found.append(p)
+    return found
+
+def output_paths(inputs: List[Path],
+                 output_dir: Optional[str] = None,
+                 suffix: str = ".jl") -> List[Path]:
+    def target(p: Path) -> Path:
+        return p.with_name(strip_compression_suffix(p.name)).with_suffix(suffix)
+
+    if output_dir is None:
+        return [target(p) for p in inputs]
+    absolute = [Path(os.path.abspath(p)) for p in inputs]
+    root = Path(os.path.commonpath([str(p.parent) for p in absolute])) if absolute else Path(".")
+    return [Path(output_dir) / target(p.relative_to(root)) for p in absolute]
+
+def resolve_collisions(inputs: List[Path],
+                       outputs: List[Path]) -> Tuple[List[Path], List[Path], List[Tuple[Path, Path]]]:
+    # 多个输入写到同一个输出时: 若它们只差压缩后缀 (exchange.out 与 exchange.out.xz), 保留未压缩的
+    # (都压缩时按 COMPRESSED_SUFFIXES 的顺序), 其余以 (被跳过的输入, 保留的输入) 返回; 其他冲突报错
+    groups: Dict[str, List[int]] = {}
+    for k, dst in enumerate(outputs):
+        groups.setdefault(os.path.abspath(dst), []).append(k)
+
+    def rank(p: Path) -> int:
+        for n, ext in enumerate(COMPRESSED_SUFFIXES, 1):
+            if p.name.endswith(ext):
+                return n
+        return 0
+
+    dropped = set()
+    skipped: List[Tuple[Path, Path]] = []
+    for dst, members in groups.items():
+        if len(members) < 2:
+            continue
+        stems = {os.path.abspath(strip_compression_suffix(str(inputs[k]))) for k in members}
+        if len(stems) > 1:
+            names = ", ".join(str(inputs[k]) for k in members)
+            raise ValueError(f"多个输入会写到同一个输出文件 {dst}: {names}")
+        keep = min(members, key=lambda k: (rank(inputs[k]), k))
+        for k in members:
+            if k != keep:
+                dropped.add(k)
+                skipped.append((inputs[k], inputs[keep]))
+    kept = [k for k in range(len(inputs)) if k not in dropped]
+    return [inputs[k] for k in kept], [outputs[k] for k in kept], skipped
+
+def _convert_one(job: Tuple[str, str, Dict[str, Any]]) -> Tuple[str, str, Optional[str]]:
+    src, dst, options = job
+    try:
+        Path(dst).parent.mkdir(parents=True, exist_ok=True)
+        write_sunny_julia_file(src, dst, **options)
+    except Exception as exc:
+        return src, dst, f"{type(exc).__name__}: {exc}"
+    return src, dst, None
+
+def convert_many(inputs: List[Path],
+                 outputs: List[Path],
+                 options: Dict[str, Any],
+                 workers: Optional[int] = None) -> Iterable[Tuple[str, str, Optional[str]]]:
+    jobs = [(str(src), str(dst), options) for src, dst in zip(inputs, outputs)]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs)))
+    if workers == 1:
+        for job in jobs:
+            yield _convert_one(job)
+        return
+    # 进程池只启动一次, 每个 worker 按块处理多个文件, 摊薄解释器启动开销
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_convert_one, jobs, chunksize=chunksize)
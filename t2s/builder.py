@@ -1,10 +1,70 @@
-from typing import List, Optional
-from .core.soc_detector import detect_soc
-from .generators.lattice_generator import make_sunny_latvecs_block
-from .generators.atom_generator import make_sunny_atoms_block
-from .generators.exchange_generator import make_sunny_exchange_block
-from .generators.dipole_generator import make_sunny_dipole_block
-from .generators.relax_generator import make_relax_block
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .core.exchange_out import ExchangeOut, load_exchange_out
+from .core.cache import ParseCache
+from .core.external_sort import SpilledBonds
+from .core.pushdown import BondFilter, filter_table, make_bond_filter
+from .profiling import Profiler, get_profiler
+from .generators.writer import LineWriter, open_output, render_block
+from .generators.lattice_generator import write_sunny_latvecs_block
+from .generators.atom_generator import check_spins, write_sunny_atoms_block
+from .generators.exchange_generator import (check_exchange_format, select_exchange_shells,
+                                             write_sunny_exchange_block)
+from .generators.dipole_generator import write_sunny_dipole_block
+from .generators.relax_generator import write_relax_block
+
+def load_model(exchange_path: str,
+               cache: Optional[ParseCache] = None,
+               profiler: Optional[Profiler] = None,
+               where: Optional[BondFilter] = None,
+               workers: Optional[int] = None,
+               memory_budget: Optional[int] = None) -> ExchangeOut:
+    # workers: 并行解析交换段的进程数 (None/1 为串行).
+    # memory_budget: 键的内存预算 (字节); 给出时 model.bonds 是外部排序的 SpilledBonds,
+    # 用完后需要 close() 删除溢出文件
+    profiler = get_profiler(profiler)
+    with profiler.stage("load"):
+        if memory_budget is not None:
+            check_memory_budget(memory_budget, cache=cache)
+            # 并行解析会把各块的结果整块留在内存中, 这里只串行解析
+            model = load_exchange_out(exchange_path, profiler=profiler, where=where,
+                                      bonds=SpilledBonds(memory_budget))
+            profiler.count("runs", model.bonds.runs)
+        elif cache is not None:
+            # 缓存中是完整的模型, 命中后再过滤
+            model = cache.load(exchange_path, workers=workers, profiler=profiler)
+            model.bonds = filter_table(model.bonds, where)
+        else:
+            model = load_exchange_out(exchange_path, profiler=profiler, where=where, workers=workers)
+        profiler.count("bonds", len(model.bonds))
+    return model
+
+def check_memory_budget(memory_budget: Optional[int] = None,
+                        exchange_format: str = "bonds",
+                        symmetry_reduce: bool = False,
+                        cache: Optional[ParseCache] = None,
+                        incremental: bool = False,
+                        **_) -> None:
+    # 外部排序只支持逐键写出; 在解析和写出任何内容之前检查参数组合
+    if memory_budget is None:
+        return
+    if memory_budget <= 0:
+        raise ValueError(f"内存预算必须为正数: {memory_budget}")
+    if exchange_format != "bonds" or symmetry_reduce:
+        raise ValueError("外部排序 (--memory-budget) 只支持 bonds 格式, 不能与对称约化同时使用。")
+    if cache is not None:
+        raise ValueError("外部排序 (--memory-budget) 不能与解析缓存同时使用。")
+    if incremental:
+        raise ValueError("外部排序 (--memory-budget) 不能与增量生成同时使用。")
+
+def parse_filter(max_dist: float = 0.0,
+                 dist_tol: float = 1e-3,
+                 min_exchange: float = 1e-3,
+                 prefilter: bool = False,
+                 pair_labels: Optional[List[str]] = None) -> Optional[BondFilter]:
+    # max_dist 截断总是下推到解析阶段 (结果不变); 按键的 min_exchange 过滤需要 prefilter
+    return make_bond_filter(max_dist, dist_tol,
+                            min_exchange=min_exchange if prefilter else None,
+                            pair_labels=pair_labels)
 
 def build_sunny_julia(exchange_path: str,
                       soc_mode: str = "auto",
@@ -16,43 +76,185 @@ def build_sunny_julia(exchange_path: str,
                       min_exchange: float = 1e-3,
                       with_dipole: bool = False,
                       with_relax: bool = False,
-                      spins: Optional[List[str]] = None) -> str:
+                      spins: Optional[List[str]] = None,
+                      exchange_format: str = "bonds",
+                      symmetry_reduce: bool = False,
+                      symprec: float = 1e-3,
+                      cache: Optional[ParseCache] = None,
+                      profiler: Optional[Profiler] = None,
+                      prefilter: bool = False,
+                      pair_labels: Optional[List[str]] = None,
+                      parse_jobs: Optional[int] = None) -> str:
+    where = parse_filter(max_dist, dist_tol, min_exchange, prefilter, pair_labels)
+    model = load_model(exchange_path, cache, profiler, where, parse_jobs)
+    return render_sunny_julia(model,
+                              soc_mode=soc_mode,
+                              mag_threshold=mag_threshold,
+                              j_tol=j_tol, d_tol=d_tol, dist_tol=dist_tol,
+                              max_dist=max_dist, min_exchange=min_exchange,
+                              with_dipole=with_dipole,
+                              with_relax=with_relax,
+                              spins=spins,
+                              exchange_format=exchange_format,
+                              symmetry_reduce=symmetry_reduce,
+                              symprec=symprec,
+                              profiler=profiler)
+
+def write_sunny_julia_file(exchange_path: str,
+                           output_path: str,
+                           atomic: bool = True,
+                           cache: Optional[ParseCache] = None,
+                           profiler: Optional[Profiler] = None,
+                           incremental: bool = False,
+                           prefilter: bool = False,
+                           pair_labels: Optional[List[str]] = None,
+                           parse_jobs: Optional[int] = None,
+                           memory_budget: Optional[int] = None,
+                           **options) -> Optional[List[str]]:
+    # incremental=True 时只重算输入有变化的段, 返回内容变化的段名
+    check_memory_budget(memory_budget, cache=cache, incremental=incremental, **options)
+    where = parse_filter(options.get("max_dist", 0.0), options.get("dist_tol", 1e-3),
+                         options.get("min_exchange", 1e-3), prefilter, pair_labels)
+    if memory_budget is not None:
+        model = load_model(exchange_path, cache, profiler, where, memory_budget=memory_budget)
+        try:
+            with open_output(output_path, atomic=atomic) as fh:
+                write_sunny_julia(model, LineWriter(fh), profiler=profiler, **options)
+        finally:
+            model.bonds.close()
+        return None
+    model = load_model(exchange_path, cache, profiler, where, parse_jobs)
+    if incremental:
+        from .incremental import write_sunny_julia_incremental
+        return write_sunny_julia_incremental(model, output_path, atomic=atomic,
+                                             profiler=profiler, **options)
+    with open_output(output_path, atomic=atomic) as fh:
+        write_sunny_julia(model, LineWriter(fh), profiler=profiler, **options)
+    return None
+
+def render_sunny_julia(model: ExchangeOut, **options) -> str:
+    return render_block(write_sunny_julia, model, **options)
+
+def write_sunny_julia(model: ExchangeOut,
+                      out: LineWriter,
+                      profiler: Optional[Profiler] = None,
+                      **options) -> None:
+    profiler = get_profiler(profiler)
+    with profiler.stage("write"):
+        for _, _, write in sunny_sections(model, profiler=profiler, **options):
+            write(out)
+
+def sunny_sections(model: ExchangeOut,
+                   soc_mode: str = "auto",
+                   mag_threshold: float = 0.5,
+                   j_tol: float = 1e-3,
+                   d_tol: float = 1e-3,
+                   dist_tol: float = 1e-3,
+                   max_dist: float = 0.0,
+                   min_exchange: float = 1e-3,
+                   with_dipole: bool = False,
+                   with_relax: bool = False,
+                   spins: Optional[List[str]] = None,
+                   exchange_format: str = "bonds",
+                   symmetry_reduce: bool = False,
+                   symprec: float = 1e-3,
+                   profiler: Optional[Profiler] = None,
+                   grouped_shells: Optional[List[Dict[str, Any]]] = None
+                   ) -> List[Tuple[str, Dict[str, Any], Callable[[LineWriter], None]]]:
+    # 脚本按段生成: (段名, 该段依赖的输入, 写出函数). inputs["model"] 列出用到的解析数据
+    # (cell/atoms/bonds), 其余为参数; 增量生成据此判断哪些段需要重算
+    profiler = get_profiler(profiler)
     if soc_mode == "soc":
         is_soc = True
     elif soc_mode == "no-soc":
         is_soc = False
     else:
-        is_soc = detect_soc(exchange_path)
-
-    parts: List[str] = []
-    parts += [
-        "# Autogenerated from TB2J exchange.out",
-        "using Sunny",
-        "using LinearAlgebra",
-        "using GLMakie",
-        "units = Units(:meV, :angstrom)",
-        f"# Detected SOC mode: {'SOC (non-collinear)' if is_soc else 'no SOC (collinear)'}",
-        "",
-        make_sunny_latvecs_block(exchange_path),
-        "",
-        make_sunny_atoms_block(exchange_path,
-                               mag_threshold=mag_threshold,
-                               is_soc=is_soc,
-                               spins=spins),
-        "",
-        make_sunny_exchange_block(exchange_path,
-                                  mag_threshold=mag_threshold,
-                                  j_tol=j_tol, d_tol=d_tol, dist_tol=dist_tol,
-                                  max_dist=max_dist, min_exchange=min_exchange,
-                                  use_dmi=is_soc,
-                                  spins=spins),
-    ]
+        is_soc = model.is_soc
+
+    crystal_symprec = symprec if symmetry_reduce else None
+
+    # 在写出任何内容之前检查 S, 避免输出半截脚本
+    with profiler.stage("magnetic_atoms"):
+        atoms = model.magnetic_atoms(mag_threshold, is_soc=is_soc)
+        profiler.count("atoms", len(atoms))
+    check_spins(atoms, spins)
+    check_exchange_format(exchange_format)
 
+    def header(out: LineWriter) -> None:
+        out.lines([
+            "# Autogenerated from TB2J exchange.out",
+            "using Sunny",
+            "using LinearAlgebra",
+            "using GLMakie",
+            "units = Units(:meV, :angstrom)",
+            f"# Detected SOC mode: {'SOC (non-collinear)' if is_soc else 'no SOC (collinear)'}",
+            "",
+        ])
+
+    def lattice(out: LineWriter) -> None:
+        with profiler.stage("lattice"):
+            write_sunny_latvecs_block(model, out)
+        out.line("")
+
+    def atoms_block(out: LineWriter) -> None:
+        with profiler.stage("atoms"):
+            write_sunny_atoms_block(model, out,
+                                    mag_threshold=mag_threshold,
+                                    is_soc=is_soc,
+                                    spins=spins,
+                                    symprec=crystal_symprec)
+        out.line("")
+
+    selected = None
+    if crystal_symprec is not None:
+        # 对称约化可能因耦合不一致而报错, 在写出任何段之前完成
+        with profiler.stage("exchange_shells"):
+            selected = select_exchange_shells(model,
+                                              mag_threshold=mag_threshold,
+                                              j_tol=j_tol, d_tol=d_tol, dist_tol=dist_tol,
+                                              max_dist=max_dist, min_exchange=min_exchange,
+                                              use_dmi=is_soc,
+                                              symprec=crystal_symprec,
+                                              profiler=profiler,
+                                              grouped_shells=grouped_shells)
+
+    def exchange(out: LineWriter) -> None:
+        with profiler.stage("exchange"):
+            write_sunny_exchange_block(model, out,
+                                       mag_threshold=mag_threshold,
+                                       j_tol=j_tol, d_tol=d_tol, dist_tol=dist_tol,
+                                       max_dist=max_dist, min_exchange=min_exchange,
+                                       use_dmi=is_soc,
+                                       spins=spins,
+                                       exchange_format=exchange_format,
+                                       symprec=crystal_symprec,
+                                       profiler=profiler,
+                                       grouped_shells=grouped_shells,
+                                       selected_shells=selected)
+
+    def dipole(out: LineWriter) -> None:
+        out.line("")
+        with profiler.stage("dipole"):
+            write_sunny_dipole_block(model, out,
+                                     mag_threshold=mag_threshold,
+                                     is_soc=is_soc)
+
+    def relax(out: LineWriter) -> None:
+        out.line("")
+        write_relax_block(out)
+
+    atom_inputs = {"model": ["cell", "atoms"], "mag_threshold": mag_threshold, "is_soc": is_soc}
+    sections = [
+        ("header", {"is_soc": is_soc}, header),
+        ("lattice", {"model": ["cell"]}, lattice),
+        ("atoms", dict(atom_inputs, spins=spins, symprec=crystal_symprec), atoms_block),
+        ("exchange", dict(atom_inputs, model=["cell", "atoms", "bonds"],
+                          j_tol=j_tol, d_tol=d_tol, dist_tol=dist_tol,
+                          max_dist=max_dist, min_exchange=min_exchange, spins=spins,
+                          exchange_format=exchange_format, symprec=crystal_symprec), exchange),
+    ]
     if with_dipole:
-        parts += ["", make_sunny_dipole_block(exchange_path,
-                                                mag_threshold=mag_threshold,
-                                                is_soc=is_soc)]
+        sections.append(("dipole", atom_inputs, dipole))
     if with_relax:
-        parts += ["", make_relax_block()]
-
-    return "\n".join(parts)
+        sections.append(("relax", {}, relax))
+    return sections
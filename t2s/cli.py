@@ -1,8 +1,13 @@
 import argparse
+import sys
 from pathlib import Path
-from .builder import build_sunny_julia
-
-ALLOWED_SPINS = {"1/2", "1", "3/2", "2", "2/5", "3", "2/7"}
+from .builder import (check_memory_budget, load_model, parse_filter, write_sunny_julia,
+                      write_sunny_julia_file)
+from .generators.atom_generator import check_spin_value
+from .generators.exchange_generator import EXCHANGE_FORMATS
+from .generators.writer import LineWriter, deferred_output
+from .core.cache import CACHE_KEYS, DEFAULT_CACHE_SIZE, ParseCache
+from .profiling import Profiler
 
 def parse_spins(spin_args):
     if not spin_args:
@@ -13,23 +18,34 @@ def parse_spins(spin_args):
             value = part.strip()
             if not value:
                 continue
-            if value not in ALLOWED_SPINS:
-                raise ValueError(
-                    f"不支持的 S 值: {value}. 允许的值: {', '.join(sorted(ALLOWED_SPINS))}."
-                )
-            spins.append(value)
+            spins.append(check_spin_value(value))
     return spins
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("exchange", nargs="?", default="exchange.out")
-    parser.add_argument("-o", "--output")
+def parse_float_list(text):
+    try:
+        return [float(part) for part in text.split(",") if part.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无法解析的数值列表: {text}")
+
+def parse_labels(text):
+    return [part.strip() for part in text.split(",") if part.strip()]
+
+def add_conversion_arguments(parser, sweep=(), parsing=True, cache=True):
+    # sweep 中列出的参数接受逗号分隔的取值列表 (t2s sweep); parsing/cache 控制是否提供解析阶段与
+    # 解析缓存的选项 (t2s client 由服务端解析, 两者都不提供)
+    def tolerance(flag, default):
+        if flag[2:].replace("-", "_") in sweep:
+            parser.add_argument(flag, type=parse_float_list, default=[default],
+                                help="逗号分隔的取值列表, 每个组合生成一个文件")
+        else:
+            parser.add_argument(flag, type=float, default=default)
+
     parser.add_argument("--mag-threshold", type=float, default=0.5)
-    parser.add_argument("--j-tol", type=float, default=1e-3)
-    parser.add_argument("--d-tol", type=float, default=1e-3)
-    parser.add_argument("--dist-tol", type=float, default=1e-3)
-    parser.add_argument("--max-dist", type=float, default=0.0)
-    parser.add_argument("--min-exchange", type=float, default=1e-3)
+    tolerance("--j-tol", 1e-3)
+    tolerance("--d-tol", 1e-3)
+    tolerance("--dist-tol", 1e-3)
+    tolerance("--max-dist", 0.0)
+    tolerance("--min-exchange", 1e-3)
 
     soc = parser.add_mutually_exclusive_group()
     soc.add_argument("--soc", action="store_true")
@@ -43,15 +59,33 @@ def main():
         help="为每个磁性原子指定 S (可重复或逗号分隔). 允许值: 1/2, 1, 3/2, 2, 2/5, 3, 2/7",
     )
 
-    args = parser.parse_args()
+    parser.add_argument("--exchange-format", choices=EXCHANGE_FORMATS, default="bonds",
+                        help="bonds: 每个键一行 set_exchange!; arrays: 键数据写成数组并用循环设置")
 
-    import sys
-    from pathlib import Path
-    if not Path(args.exchange).exists():
-        print(f"[ERROR] exchange.out not found: {args.exchange}", file=sys.stderr)
-        sys.exit(1)
+    parser.add_argument("--symmetry-reduce", action="store_true",
+                        help="每个对称等价类只写出一个键, 由 Sunny 按晶体对称性传播")
+    parser.add_argument("--symprec", type=float, default=1e-3,
+                        help="对称性判定的位置容差 (Å)")
+
+    if parsing:
+        parser.add_argument("--parse-jobs", type=int, default=None, metavar="N",
+                            help="用 N 个进程并行解析交换段 (按分隔线切块, 结果与串行一致)")
+        parser.add_argument("--prefilter", action="store_true",
+                            help="解析时按单个键丢弃 |J| 与 |D| 都不超过 --min-exchange 的键 "
+                                 "(更快, 但类型聚类可能与默认结果不同)")
+        parser.add_argument("--pair-labels", type=parse_labels, metavar="LABELS",
+                            help="逗号分隔的原子标签; 只保留 i 与 j 都在列表中的键, 其余在解析时丢弃")
 
+    if cache:
+        parser.add_argument("--cache", action="store_true",
+                            help="缓存解析结果 (默认目录 ~/.cache/t2s)")
+        parser.add_argument("--cache-dir", help="缓存目录 (隐含 --cache)")
+        parser.add_argument("--cache-size", type=float, default=DEFAULT_CACHE_SIZE / 2**20,
+                            help="缓存容量上限 (MB), 超出后按 LRU 淘汰")
+        parser.add_argument("--cache-key", choices=CACHE_KEYS, default="stat",
+                            help="stat: 路径+大小+mtime; content: 文件内容哈希")
 
+def conversion_options(args):
     if args.soc:
         soc_mode = "soc"
     elif args.no_soc:
@@ -59,30 +93,318 @@ def main():
     else:
         soc_mode = "auto"
 
+    options = dict(
+        soc_mode=soc_mode,
+        mag_threshold=args.mag_threshold,
+        j_tol=args.j_tol,
+        d_tol=args.d_tol,
+        dist_tol=args.dist_tol,
+        max_dist=args.max_dist,
+        min_exchange=args.min_exchange,
+        with_dipole=args.with_dipole,
+        with_relax=args.with_relax,
+        spins=parse_spins(args.spin),
+        exchange_format=args.exchange_format,
+        symmetry_reduce=args.symmetry_reduce,
+        symprec=args.symprec,
+    )
+    if hasattr(args, "cache"):
+        options["cache"] = None
+        if args.cache or args.cache_dir:
+            options["cache"] = ParseCache(args.cache_dir,
+                                          max_bytes=int(args.cache_size * 2**20),
+                                          key=args.cache_key)
+    if hasattr(args, "parse_jobs"):
+        options["prefilter"] = args.prefilter
+        options["pair_labels"] = args.pair_labels
+        options["parse_jobs"] = args.parse_jobs
+    if getattr(args, "memory_budget", None) is not None:
+        options["memory_budget"] = int(args.memory_budget * 2**20)
+        check_memory_budget(incremental=getattr(args, "incremental", False), **options)
+    return options
+
+def add_memory_budget_argument(parser):
+    parser.add_argument("--memory-budget", type=float, metavar="MB",
+                        help="键的内存预算 (MB); 超出时按距离排序写入临时文件再归并, 结果与默认相同. "
+                             "只支持 bonds 格式, 不能与 --symmetry-reduce/--cache/--incremental 同时使用")
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("exchange", nargs="?", default="exchange.out")
+    parser.add_argument("-o", "--output")
+    parser.add_argument("--no-atomic", action="store_true",
+                        help="直接写入输出文件, 不经过临时文件 + rename")
+    parser.add_argument("--profile", nargs="?", const="-", metavar="REPORT.json",
+                        help="记录各阶段耗时/内存峰值/计数; 不带参数时在 stderr 打印表格, 否则写成 JSON")
+    parser.add_argument("--incremental", action="store_true",
+                        help="按段比较输入哈希, 只重算变化的段; 内容不变时不改写输出文件 (需要 -o)")
+    parser.add_argument("--changed-sections", action="store_true",
+                        help="在 stderr 列出内容发生变化的段 (隐含 --incremental)")
+    add_conversion_arguments(parser)
+    add_memory_budget_argument(parser)
+
+    args = parser.parse_args(argv)
+
+    if not Path(args.exchange).exists():
+        print(f"[ERROR] exchange.out not found: {args.exchange}", file=sys.stderr)
+        sys.exit(1)
+    incremental = args.incremental or args.changed_sections
+    if incremental and not args.output:
+        print("[ERROR] --incremental/--changed-sections 需要 -o 指定输出文件", file=sys.stderr)
+        sys.exit(1)
+
+    profiler = Profiler() if args.profile else None
+    try:
+        options = conversion_options(args)
+        if args.output:
+            changed = write_sunny_julia_file(args.exchange, args.output,
+                                             atomic=not args.no_atomic, profiler=profiler,
+                                             incremental=incremental, **options)
+            if args.changed_sections:
+                print(f"[CHANGED] {', '.join(changed) if changed else '(none)'}", file=sys.stderr)
+        else:
+            where = parse_filter(options["max_dist"], options["dist_tol"], options["min_exchange"],
+                                 options.pop("prefilter"), options.pop("pair_labels"))
+            model = load_model(args.exchange, options.pop("cache"), profiler, where,
+                               options.pop("parse_jobs"), options.pop("memory_budget", None))
+            try:
+                with deferred_output(sys.stdout) as fh:
+                    write_sunny_julia(model, LineWriter(fh), profiler=profiler, **options)
+                    fh.write("\n")
+            finally:
+                if hasattr(model.bonds, "close"):
+                    model.bonds.close()
+    except ValueError as exc:
+        print(f"[ERROR] {exc}", file=sys.stderr)
+        sys.exit(1)
+
+    if profiler is not None:
+        write_profile(profiler, args.profile)
+
+def write_profile(profiler: Profiler, target: str) -> None:
+    if target == "-":
+        print(profiler.format_table(), file=sys.stderr)
+    else:
+        with open(target, "w", encoding="utf-8") as fh:
+            profiler.write_json(fh)
+
+def batch_main(argv):
+    from .batch import DEFAULT_PATTERN, convert_many, discover_inputs, output_paths, resolve_collisions
+
+    parser = argparse.ArgumentParser(prog="t2s batch")
+    parser.add_argument("inputs", nargs="+",
+                        help="exchange.out 文件、目录 (递归查找) 或 glob 模式")
+    parser.add_argument("--pattern", default=DEFAULT_PATTERN,
+                        help=f"在目录中查找的文件名模式 (默认 {DEFAULT_PATTERN})")
+    parser.add_argument("--output-dir",
+                        help="输出目录 (保留相对目录结构); 默认写在输入文件旁边")
+    parser.add_argument("--suffix", default=".jl")
+    parser.add_argument("--no-atomic", action="store_true",
+                        help="直接写入输出文件, 不经过临时文件 + rename")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="并行进程数 (默认 CPU 核数)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="只重算输入有变化的段, 内容不变的输出文件保持不动")
+    add_conversion_arguments(parser)
+    add_memory_budget_argument(parser)
+
+    args = parser.parse_args(argv)
+
+    try:
+        options = conversion_options(args)
+    except ValueError as exc:
+        print(f"[ERROR] {exc}", file=sys.stderr)
+        sys.exit(1)
+    options["atomic"] = not args.no_atomic
+    options["incremental"] = args.incremental
+
+    inputs = discover_inputs(args.inputs, pattern=args.pattern)
+    if not inputs:
+        print("[ERROR] no exchange.out files found", file=sys.stderr)
+        sys.exit(1)
+    outputs = output_paths(inputs, output_dir=args.output_dir, suffix=args.suffix)
+    try:
+        inputs, outputs, skipped = resolve_collisions(inputs, outputs)
+    except ValueError as exc:
+        print(f"[ERROR] {exc}", file=sys.stderr)
+        sys.exit(1)
+    for src, kept in skipped:
+        print(f"[WARN] skipping {src}: same output as {kept}", file=sys.stderr)
+
+    failed = 0
+    for src, dst, error in convert_many(inputs, outputs, options, workers=args.jobs):
+        if error is None:
+            print(f"[OK] {src} -> {dst}", file=sys.stderr)
+        else:
+            failed += 1
+            print(f"[ERROR] {src}: {error}", file=sys.stderr)
+
+    print(f"[DONE] {len(inputs) - failed}/{len(inputs)} converted", file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+def inventory_main(argv):
+    from .batch import DEFAULT_PATTERN, discover_inputs
+    from .generators.writer import open_output
+    from .inventory import INVENTORY_FORMATS, probe_many, write_inventory
+
+    parser = argparse.ArgumentParser(prog="t2s inventory")
+    parser.add_argument("inputs", nargs="+",
+                        help="exchange.out 文件、目录 (递归查找) 或 glob 模式")
+    parser.add_argument("--pattern", default=DEFAULT_PATTERN,
+                        help=f"在目录中查找的文件名模式 (默认 {DEFAULT_PATTERN})")
+    parser.add_argument("-o", "--output", help="清单文件; 默认写到 stdout")
+    parser.add_argument("--format", choices=INVENTORY_FORMATS,
+                        help="默认按 -o 的扩展名选择, 否则为 csv")
+    parser.add_argument("--mag-threshold", type=float, default=0.5)
+    parser.add_argument("--bonds", action="store_true",
+                        help="扫描整个交换段统计键数与最大距离 (只看键头), SOC 判断覆盖整个文件")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="并行进程数 (默认 CPU 核数)")
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt is None:
+        fmt = "json" if args.output and args.output.endswith(".json") else "csv"
+
+    inputs = discover_inputs(args.inputs, pattern=args.pattern)
+    if not inputs:
+        print("[ERROR] no exchange.out files found", file=sys.stderr)
+        sys.exit(1)
+
+    rows = list(probe_many(inputs, mag_threshold=args.mag_threshold,
+                           count_bonds=args.bonds, workers=args.jobs))
+    failed = 0
+    for info in rows:
+        if info["error"] is not None:
+            failed += 1
+            print(f"[ERROR] {info['path']}: {info['error']}", file=sys.stderr)
+    if args.output:
+        with open_output(args.output) as fh:
+            write_inventory(rows, fh, fmt)
+    else:
+        write_inventory(rows, sys.stdout, fmt)
+
+    print(f"[DONE] {len(rows) - failed}/{len(rows)} probed", file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+def sweep_main(argv):
+    from .sweep import SWEEP_PARAMETERS, format_value, run_sweep
+
+    parser = argparse.ArgumentParser(prog="t2s sweep")
+    parser.add_argument("exchange", nargs="?", default="exchange.out")
+    parser.add_argument("--output-dir", default="sweep",
+                        help="输出目录, 每个参数组合一个 Julia 文件, 另附 sweep.json 索引")
+    parser.add_argument("--prefix", default="sunny")
+    parser.add_argument("--no-atomic", action="store_true",
+                        help="直接写入输出文件, 不经过临时文件 + rename")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="并行进程数 (默认 CPU 核数)")
+    add_conversion_arguments(parser, sweep=SWEEP_PARAMETERS)
+
+    args = parser.parse_args(argv)
+
+    if not Path(args.exchange).exists():
+        print(f"[ERROR] exchange.out not found: {args.exchange}", file=sys.stderr)
+        sys.exit(1)
+
     try:
-        spins = parse_spins(args.spin)
-        code = build_sunny_julia(
-            exchange_path=args.exchange,
-            soc_mode=soc_mode,
-            mag_threshold=args.mag_threshold,
-            j_tol=args.j_tol,
-            d_tol=args.d_tol,
-            dist_tol=args.dist_tol,
-            max_dist=args.max_dist,
-            min_exchange=args.min_exchange,
-            with_dipole=args.with_dipole,
-            with_relax=args.with_relax,
-            spins=spins,
-        )
+        options = conversion_options(args)
+        grid = {name: options.pop(name) for name in SWEEP_PARAMETERS}
+        cache = options.pop("cache")
+        options["atomic"] = not args.no_atomic
+
+        failed = 0
+        total = 0
+        for point, dst, error in run_sweep(args.exchange, args.output_dir, grid, options,
+                                           workers=args.jobs, cache=cache, prefix=args.prefix):
+            total += 1
+            label = ", ".join(f"{k}={format_value(v)}" for k, v in point.items())
+            if error is None:
+                print(f"[OK] {label} -> {dst}", file=sys.stderr)
+            else:
+                failed += 1
+                print(f"[ERROR] {label}: {error}", file=sys.stderr)
     except ValueError as exc:
         print(f"[ERROR] {exc}", file=sys.stderr)
         sys.exit(1)
 
+    print(f"[DONE] {total - failed}/{total} points written", file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+def serve_main(argv):
+    from .server import DEFAULT_HOST, DEFAULT_MAX_MODELS, DEFAULT_PORT, ModelCache, make_server
+
+    parser = argparse.ArgumentParser(prog="t2s serve")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help=f"监听地址 (默认 {DEFAULT_HOST}, 仅本机)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-models", type=int, default=DEFAULT_MAX_MODELS,
+                        help="内存中保留的已解析 exchange.out 数量 (LRU)")
+    parser.add_argument("--cache-dir", help="未命中时同时使用磁盘解析缓存")
+    parser.add_argument("--quiet", action="store_true", help="不打印请求日志")
+    args = parser.parse_args(argv)
+
+    parse_cache = ParseCache(args.cache_dir) if args.cache_dir else None
+    server = make_server(args.host, args.port,
+                         ModelCache(args.max_models, parse_cache=parse_cache), quiet=args.quiet)
+    host, port = server.server_address[:2]
+    print(f"[SERVE] t2s listening on http://{host}:{port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def client_main(argv):
+    from .server import DEFAULT_HOST, DEFAULT_PORT, request_build
+    from .generators.writer import open_output
+
+    parser = argparse.ArgumentParser(prog="t2s client")
+    parser.add_argument("exchange", nargs="?", default="exchange.out")
+    parser.add_argument("-o", "--output")
+    parser.add_argument("--no-atomic", action="store_true",
+                        help="直接写入输出文件, 不经过临时文件 + rename")
+    parser.add_argument("--server", default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}",
+                        help="t2s serve 的地址")
+    # 只提供服务端支持的选项 (server.SERVE_OPTIONS); 解析、缓存与 --profile 都在服务端, 这里不接受
+    add_conversion_arguments(parser, parsing=False, cache=False)
+
+    args = parser.parse_args(argv)
+
+    if not Path(args.exchange).exists():
+        print(f"[ERROR] exchange.out not found: {args.exchange}", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        options = conversion_options(args)
+        text = request_build(args.server, args.exchange, options)
+    except (ValueError, RuntimeError) as exc:
+        print(f"[ERROR] {exc}", file=sys.stderr)
+        sys.exit(1)
+
     if args.output:
-        Path(args.output).write_text(code, encoding="utf-8")
+        with open_output(args.output, atomic=not args.no_atomic) as fh:
+            fh.write(text)
     else:
-        print(code)
+        sys.stdout.write(text)
+        sys.stdout.write("\n")
 
+COMMANDS = {
+    "batch": batch_main,
+    "inventory": inventory_main,
+    "sweep": sweep_main,
+    "serve": serve_main,
+    "client": client_main,
+}
 
 def entrypoint():
     main()
@@ -1,12 +1,31 @@
-import math, re
-from typing import List, Dict, Any, Optional
-from .lattice_reader import read_lattice_vectors, invert_3x3, matvec
+import math
+from typing import Iterable, List, Dict, Any, Optional
+from .lattice_reader import compression_of, invert_3x3, iter_lines, matvec, scan_header_lines
+from .mapped_reader import map_file, scan_header
+from .tokenizer import ELEMENT_RE
 
 def parse_magnetic_atoms(exchange_path: str,
                          mag_threshold: float = 0.5,
                          is_soc: Optional[bool] = None) -> List[Dict[str, Any]]:
-    a_vec, b_vec, c_vec, lines = read_lattice_vectors(exchange_path)
-    invA = invert_3x3(a_vec, b_vec, c_vec)
+    # 只扫描 Exchange 之前的部分, 交换段不会被读入 (压缩文件也只解压到 Exchange 行)
+    if compression_of(exchange_path) is not None:
+        lines = iter_lines(exchange_path)
+        try:
+            cell, atom_lines, _ = scan_header_lines(lines)
+        finally:
+            lines.close()
+    else:
+        with map_file(exchange_path) as buf:
+            cell, atom_lines, _ = scan_header(buf)
+    if cell is None:
+        raise RuntimeError("在 exchange.out 中没有找到 'Cell (Angstrom):' 段。")
+    return parse_atom_lines(atom_lines, cell, mag_threshold, is_soc=is_soc)
+
+def parse_atom_lines(lines: Iterable[str],
+                     cell,
+                     mag_threshold: float = 0.5,
+                     is_soc: Optional[bool] = None) -> List[Dict[str, Any]]:
+    invA = invert_3x3(*cell)
 
     atoms: List[Dict[str, Any]] = []
     in_atoms = False
@@ -60,7 +79,7 @@ def parse_magnetic_atoms(exchange_path: str,
 
         r_cart = [x, y, z]
         r_frac = matvec(invA, r_cart)
-        m_elem = re.match(r"[A-Za-z]+", name)
+        m_elem = ELEMENT_RE.match(name)
         elem = m_elem.group(0) if m_elem else name
 
         atoms.append(dict(
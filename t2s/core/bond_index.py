@@ -0,0 +1,166 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from .bond_table import BondTable
+from .symmetry import group_exchange_shells
+
+class BondIndex:
+    # 交互查询用的索引: 按 (i, j)、R、(i, j, R)、壳层/类型的哈希表, 以及按距离排序的行号 (bisect 区间查询).
+    # 各索引在第一次用到时才建立; 查询返回行号 (升序或按距离排序) 的新数组, 修改它不影响索引,
+    # bonds()/bond() 转成字典
+    def __init__(self,
+                 bonds: Union[BondTable, List[Dict[str, Any]]],
+                 shells: Optional[List[Dict[str, Any]]] = None,
+                 j_tol: float = 1e-3,
+                 d_tol: float = 1e-3,
+                 dist_tol: float = 1e-3):
+        self.table = bonds if isinstance(bonds, BondTable) else BondTable.from_bonds(bonds)
+        self.j_tol = j_tol
+        self.d_tol = d_tol
+        self.dist_tol = dist_tol
+        self._shells = shells
+        self._pairs: Optional[Dict[Tuple[int, int], array]] = None
+        self._R: Optional[Dict[Tuple[int, int, int], array]] = None
+        self._exact: Optional[Dict[Tuple[int, int, int, int, int], int]] = None
+        self._order: Optional[array] = None
+        self._sorted_distance: Optional[array] = None
+        self._by_i: Optional[Dict[int, Tuple[array, array]]] = None
+        self._shell_of: Optional[array] = None
+        self._type_of: Optional[array] = None
+        self._couplings = None
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def pair_rows(self, i_label: str, j_label: str, symmetric: bool = False) -> array:
+        # symmetric=True 时同时包含 (j, i) 方向的键
+        pairs = self._pair_index()
+        i = self.table.label_id(i_label)
+        j = self.table.label_id(j_label)
+        if i is None or j is None:
+            return array("q")
+        rows = array("q", pairs.get((i, j), ()))
+        if symmetric and i != j:
+            rows = array("q", sorted(rows + pairs.get((j, i), array("q"))))
+        return rows
+
+    def R_rows(self, R: Sequence[int]) -> array:
+        return array("q", self._R_index().get(tuple(R), ()))
+
+    def find(self, i_label: str, j_label: str, R: Sequence[int]) -> Optional[int]:
+        # (i, j, R) 唯一确定一个键; 文件中重复出现时返回第一个
+        if self._exact is None:
+            table = self.table
+            exact: Dict[Tuple[int, int, int, int, int], int] = {}
+            for k in range(len(table)):
+                key = (table.i[k], table.j[k], table.R[3*k], table.R[3*k + 1], table.R[3*k + 2])
+                exact.setdefault(key, k)
+            self._exact = exact
+        i = self.table.label_id(i_label)
+        j = self.table.label_id(j_label)
+        if i is None or j is None:
+            return None
+        return self._exact.get((i, j) + tuple(R))
+
+    def distance_rows(self, lo: float = 0.0, hi: float = float("inf")) -> array:
+        # lo <= distance <= hi 的键, 按距离排序 (距离相同时保持文件顺序)
+        order, distance = self._distance_index()
+        return order[bisect_left(distance, lo):bisect_right(distance, hi)]
+
+    def neighbour_rows(self, label: str, max_dist: float, min_dist: float = 0.0) -> array:
+        # 以 label 为 i 的键中距离在 [min_dist, max_dist] 内的, 按距离排序
+        if self._by_i is None:
+            order, _ = self._distance_index()
+            table = self.table
+            by_i: Dict[int, Tuple[array, array]] = {}
+            for k in order:
+                rows, dists = by_i.setdefault(table.i[k], (array("q"), array("d")))
+                rows.append(k)
+                dists.append(table.distance[k])
+            self._by_i = by_i
+        i = self.table.label_id(label)
+        if i is None or i not in self._by_i:
+            return array("q")
+        rows, dists = self._by_i[i]
+        return rows[bisect_left(dists, min_dist):bisect_right(dists, max_dist)]
+
+    @property
+    def shells(self) -> List[Dict[str, Any]]:
+        if self._shells is None:
+            self._shells = group_exchange_shells(self.table, j_tol=self.j_tol, d_tol=self.d_tol,
+                                                 dist_tol=self.dist_tol)
+        return self._shells
+
+    def shell_rows(self, shell: int, type_id: Optional[int] = None) -> array:
+        # 壳层按 group_exchange_shells 的顺序从 1 开始编号, 类型从 0 开始 (未过滤时即脚本中的 J{n}/J{n}_A)
+        if not 1 <= shell <= len(self.shells):
+            raise ValueError(f"壳层编号超出范围: {shell} (共 {len(self.shells)} 个壳层)。")
+        s = self.shells[shell - 1]
+        if type_id is None:
+            return array("q", s["rows"])
+        if not 0 <= type_id < len(s["types"]):
+            raise ValueError(f"类型编号超出范围: {type_id} (壳层 {shell} 共 {len(s['types'])} 个类型)。")
+        return array("q", s["types"][type_id]["rows"])
+
+    def shell_of(self, row: int) -> Tuple[int, int]:
+        if self._shell_of is None:
+            shell_of = array("q", [0]) * len(self.table)
+            type_of = array("q", [-1]) * len(self.table)
+            for n, s in enumerate(self.shells, 1):
+                for t, typ in enumerate(s["types"]):
+                    for k in typ["rows"]:
+                        shell_of[k] = n
+                        type_of[k] = t
+            self._shell_of = shell_of
+            self._type_of = type_of
+        return self._shell_of[row], self._type_of[row]
+
+    def coupling(self, row: int) -> Tuple[float, float]:
+        # Sunny 约定的 (J, |D|), 与生成的脚本相同
+        if self._couplings is None:
+            self._couplings = self.table.couplings()
+        J, D = self._couplings
+        return J[row], D[row]
+
+    def bond(self, row: int) -> Dict[str, Any]:
+        bond = self.table[row]
+        bond["row"] = row
+        bond["J"], bond["D"] = self.coupling(row)
+        bond["shell"], bond["type"] = self.shell_of(row)
+        return bond
+
+    def bonds(self, rows: Sequence[int]) -> List[Dict[str, Any]]:
+        return [self.bond(k) for k in rows]
+
+    def _pair_index(self) -> Dict[Tuple[int, int], array]:
+        if self._pairs is None:
+            table = self.table
+            pairs: Dict[Tuple[int, int], array] = {}
+            for k, (i, j) in enumerate(zip(table.i, table.j)):
+                rows = pairs.get((i, j))
+                if rows is None:
+                    rows = pairs[(i, j)] = array("q")
+                rows.append(k)
+            self._pairs = pairs
+        return self._pairs
+
+    def _R_index(self) -> Dict[Tuple[int, int, int], array]:
+        if self._R is None:
+            R = self.table.R
+            index: Dict[Tuple[int, int, int], array] = {}
+            for k in range(len(self.table)):
+                key = (R[3*k], R[3*k + 1], R[3*k + 2])
+                rows = index.get(key)
+                if rows is None:
+                    rows = index[key] = array("q")
+                rows.append(k)
+            self._R = index
+        return self._R
+
+    def _distance_index(self) -> Tuple[array, array]:
+        if self._order is None:
+            order = array("q", self.table.distance_order())
+            distance = self.table.distance
+            self._order = order
+            self._sorted_distance = array("d", (distance[k] for k in order))
+        return self._order, self._sorted_distance
@@ -0,0 +1,139 @@
+import math
+from array import array
+from typing import Iterable, Iterator, List, Dict, Any, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy 是可选依赖
+    np = None
+
+class BondTable:
+    # 列式存储的交换键: 标签存为索引, 数值存为定长数组; R/disp/DMI 按 3 个一组展平
+    def __init__(self, labels: Optional[List[str]] = None):
+        self.labels: List[str] = []
+        self._label_index: Dict[str, int] = {}
+        self.i = array("i")
+        self.j = array("i")
+        self.R = array("i")
+        self.disp = array("d")
+        self.distance = array("d")
+        self.J_iso = array("d")
+        self.J_inline = array("d")
+        self.DMI = array("d")
+        for label in labels or ():
+            self.intern(label)
+
+    @classmethod
+    def from_bonds(cls, bonds: Iterable[Dict[str, Any]]) -> "BondTable":
+        table = cls()
+        table.extend(bonds)
+        return table
+
+    def intern(self, label: str) -> int:
+        idx = self._label_index.get(label)
+        if idx is None:
+            idx = len(self.labels)
+            self.labels.append(label)
+            self._label_index[label] = idx
+        return idx
+
+    def label_id(self, label: str) -> Optional[int]:
+        return self._label_index.get(label)
+
+    def append(self, bond: Dict[str, Any]) -> None:
+        self.i.append(self.intern(bond["i_label"]))
+        self.j.append(self.intern(bond["j_label"]))
+        self.R.extend(bond["R"])
+        self.disp.extend(bond["disp"])
+        self.distance.append(bond["distance"])
+        J_iso = bond["J_iso"]
+        self.J_iso.append(math.nan if J_iso is None else J_iso)
+        self.J_inline.append(bond["J_inline"])
+        self.DMI.extend(bond["DMI"])
+
+    def extend(self, bonds: Iterable[Dict[str, Any]]) -> None:
+        for b in bonds:
+            self.append(b)
+
+    def extend_table(self, other: "BondTable") -> None:
+        # 追加另一张表的全部键; 标签按 other 中的首次出现顺序并入, 与逐个 append 的结果一致
+        mapping = [self.intern(label) for label in other.labels]
+        if mapping == list(range(len(mapping))):
+            self.i.extend(other.i)
+            self.j.extend(other.j)
+        else:
+            self.i.extend(mapping[x] for x in other.i)
+            self.j.extend(mapping[x] for x in other.j)
+        self.R.extend(other.R)
+        self.disp.extend(other.disp)
+        self.distance.extend(other.distance)
+        self.J_iso.extend(other.J_iso)
+        self.J_inline.extend(other.J_inline)
+        self.DMI.extend(other.DMI)
+
+    def __len__(self) -> int:
+        return len(self.distance)
+
+    def __getitem__(self, k: int) -> Dict[str, Any]:
+        J_iso = self.J_iso[k]
+        return {
+            "i_label": self.labels[self.i[k]],
+            "j_label": self.labels[self.j[k]],
+            "R": tuple(self.R[3*k:3*k + 3]),
+            "J_inline": self.J_inline[k],
+            "disp": tuple(self.disp[3*k:3*k + 3]),
+            "distance": self.distance[k],
+            "J_iso": None if math.isnan(J_iso) else J_iso,
+            "DMI": tuple(self.DMI[3*k:3*k + 3]),
+        }
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for k in range(len(self)):
+            yield self[k]
+
+    def distance_order(self, use_numpy: Optional[bool] = None) -> Sequence[int]:
+        if _want_numpy(use_numpy):
+            return np.argsort(np.frombuffer(self.distance, dtype=np.float64), kind="stable").tolist()
+        return sorted(range(len(self)), key=self.distance.__getitem__)
+
+    def couplings(self, use_numpy: Optional[bool] = None) -> Tuple[array, array]:
+        # Sunny 约定的 J = -J_TB2J (优先 J_iso, 缺失时用行内 J), D = |DMI|
+        if _want_numpy(use_numpy):
+            J_iso = np.frombuffer(self.J_iso, dtype=np.float64)
+            J_inline = np.frombuffer(self.J_inline, dtype=np.float64)
+            dmi = np.frombuffer(self.DMI, dtype=np.float64).reshape(-1, 3)
+            J = -np.where(np.isnan(J_iso), J_inline, J_iso)
+            Dx, Dy, Dz = dmi[:, 0], dmi[:, 1], dmi[:, 2]
+            D = np.sqrt(Dx*Dx + Dy*Dy + Dz*Dz)
+            return array("d", J.tobytes()), array("d", D.tobytes())
+        J = array("d", (-(Jinl if math.isnan(Jiso) else Jiso)
+                        for Jiso, Jinl in zip(self.J_iso, self.J_inline)))
+        dmi = self.DMI
+        D = array("d", (math.sqrt(dmi[3*k]*dmi[3*k] + dmi[3*k + 1]*dmi[3*k + 1] + dmi[3*k + 2]*dmi[3*k + 2])
+                        for k in range(len(self))))
+        return J, D
+
+class BondRows(Sequence):
+    # 按需把 BondTable 的若干行读成键字典; 即 group_exchange_shells 结果中的 shell["blocks"] 与 type["bonds"]
+    def __init__(self, table: BondTable, rows: Sequence[int]):
+        self.table = table
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self.table[r] for r in self.rows[k]]
+        return self.table[self.rows[k]]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for r in self.rows:
+            yield self.table[r]
+
+def _want_numpy(use_numpy: Optional[bool]) -> bool:
+    if use_numpy is None:
+        return np is not None
+    if use_numpy and np is None:
+        raise RuntimeError("需要 numpy 才能使用 NumPy 后端。")
+    return use_numpy
@@ -0,0 +1,105 @@
+import hashlib, os, pickle, tempfile
+from pathlib import Path
+from typing import Optional
+from .exchange_out import ExchangeOut, load_exchange_out
+from ..profiling import Profiler
+
+# 解析结果格式变化时递增, 旧缓存条目自动失效
+CACHE_FORMAT = 1
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+CACHE_KEYS = ("stat", "content")
+
+def default_cache_dir() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "t2s")
+
+def file_cache_key(exchange_path: str, key: str = "stat") -> str:
+    h = hashlib.sha256(f"t2s-parse-v{CACHE_FORMAT}:{key}:".encode())
+    if key == "stat":
+        st = os.stat(exchange_path)
+        h.update(f"{os.path.abspath(exchange_path)}:{st.st_size}:{st.st_mtime_ns}".encode())
+    elif key == "content":
+        with open(exchange_path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                h.update(chunk)
+    else:
+        raise ValueError(f"未知的缓存键类型: {key}. 允许的值: {', '.join(CACHE_KEYS)}.")
+    return h.hexdigest()
+
+class ParseCache:
+    # 以 pickle 存放解析后的 ExchangeOut; 命中时刷新 mtime, 超出容量按 LRU 淘汰
+    def __init__(self,
+                 directory: Optional[str] = None,
+                 max_bytes: int = DEFAULT_CACHE_SIZE,
+                 key: str = "stat"):
+        if key not in CACHE_KEYS:
+            raise ValueError(f"未知的缓存键类型: {key}. 允许的值: {', '.join(CACHE_KEYS)}.")
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.key = key
+
+    def entry_path(self, exchange_path: str) -> Path:
+        return Path(self.directory) / f"{file_cache_key(exchange_path, self.key)}.pickle"
+
+    def load(self,
+             exchange_path: str,
+             workers: Optional[int] = None,
+             profiler: Optional[Profiler] = None) -> ExchangeOut:
+        # 未命中时完整解析, 解析各阶段记入 profiler
+        entry = self.entry_path(exchange_path)
+        model = self._read(entry)
+        if model is None:
+            model = load_exchange_out(exchange_path, profiler=profiler, workers=workers)
+            self._write(entry, model)
+            self.evict()
+        model.path = exchange_path
+        return model
+
+    def _read(self, entry: Path) -> Optional[ExchangeOut]:
+        try:
+            with open(entry, "rb") as fh:
+                model = pickle.load(fh)
+            os.utime(entry)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # 损坏或不兼容的条目直接丢弃, 重新解析
+            _unlink(entry)
+            return None
+        return model if isinstance(model, ExchangeOut) else None
+
+    def _write(self, entry: Path, model: ExchangeOut) -> None:
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=str(entry.parent), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                pickle.dump(model, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, entry)
+        except BaseException:
+            _unlink(Path(tmp))
+            raise
+
+    def evict(self) -> None:
+        entries = []
+        for p in Path(self.directory).glob("*.pickle"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            _unlink(p)
+            total -= size
+
+    def clear(self) -> None:
+        for p in Path(self.directory).glob("*.pickle"):
+            _unlink(p)
+
+def _unlink(path: Path) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
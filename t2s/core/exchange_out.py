@@ -0,0 +1,117 @@
+from dataclasses import dataclass
+from itertools import chain
+from typing import Iterable, Iterator, List, Dict, Any, Optional, Tuple
+from .atom_parser import parse_atom_lines
+from .exchange_parser import iter_exchange_bonds
+from .bond_table import BondTable
+from .lattice_reader import compression_of, iter_lines, scan_header_lines
+from .soc_detector import SocScanner
+from .parallel_parser import parse_chunks, plan_chunks
+from .pushdown import BondFilter
+from .mapped_reader import iter_mapped_bonds, map_file, scan_header, soc_in_buffer
+from ..profiling import Profiler, get_profiler
+
+@dataclass
+class ExchangeOut:
+    path: str
+    cell: Tuple[list, list, list]
+    atom_lines: List[str]
+    is_soc: bool
+    bonds: BondTable
+
+    def magnetic_atoms(self,
+                       mag_threshold: float = 0.5,
+                       is_soc: Optional[bool] = None) -> List[Dict[str, Any]]:
+        return parse_atom_lines(self.atom_lines, self.cell, mag_threshold, is_soc=is_soc)
+
+def _feed(lines: Iterable[str], soc: SocScanner) -> Iterator[str]:
+    for line in lines:
+        soc.feed(line)
+        yield line
+
+def scan_exchange_lines(lines: Iterable[str],
+                        where: Optional[BondFilter] = None
+                        ) -> Tuple[SocScanner, Optional[Tuple[list, list, list]], List[str],
+                                   Optional[Iterator[Dict[str, Any]]]]:
+    # 读到 Exchange 行为止, 返回 (SOC 检测器, cell, atom_lines, 交换记录的迭代器; 没有交换段时为 None).
+    # 交换记录按需读取, 读多少由调用方决定; SOC 标记随读过的行更新
+    soc = SocScanner()
+    it = _feed(lines, soc)
+    cell, atom_lines, exchange_line = scan_header_lines(it)
+    records = None
+    if exchange_line is not None:
+        records = iter_exchange_bonds(chain([exchange_line], it), where)
+    return soc, cell, atom_lines, records
+
+def load_exchange_out(exchange_path: str,
+                      profiler: Optional[Profiler] = None,
+                      where: Optional[BondFilter] = None,
+                      workers: Optional[int] = None,
+                      bonds: Optional[BondTable] = None) -> ExchangeOut:
+    # where: 解析时即丢弃的键 (见 pushdown.make_bond_filter), 被丢弃的键不进入 BondTable.
+    # workers > 1 时交换段按分隔线切块, 在进程池中并行解析.
+    # bonds: 接收键的容器, 默认新建 BondTable; 也可以是按内存预算溢出到磁盘的 SpilledBonds
+    profiler = get_profiler(profiler)
+    if compression_of(exchange_path) is not None:
+        # 压缩文件无法映射也无法切块, 边解压边按行解析
+        lines = profiler.count_lines(iter_lines(exchange_path))
+        return parse_exchange_out(lines, path=exchange_path, profiler=profiler, where=where,
+                                  bonds=bonds)
+    with map_file(exchange_path) as buf:
+        return parse_mapped_exchange_out(buf, path=exchange_path, profiler=profiler, where=where,
+                                         workers=workers, bonds=bonds)
+
+def parse_mapped_exchange_out(buf,
+                              path: str = "",
+                              profiler: Optional[Profiler] = None,
+                              where: Optional[BondFilter] = None,
+                              workers: Optional[int] = None,
+                              bonds: Optional[BondTable] = None) -> ExchangeOut:
+    # 与 parse_exchange_out 结果一致, 但直接在 mmap 缓冲区上按偏移定位各段, 不需要的行不生成 str.
+    # 并行解析时子进程按 path 重新映射文件
+    profiler = get_profiler(profiler)
+    profiler.count("bytes", len(buf))
+    cell, atom_lines, exchange_start = scan_header(buf)
+    if bonds is None:
+        bonds = BondTable()
+    if exchange_start is not None:
+        with profiler.stage("exchange_section"):
+            chunks = [(exchange_start, len(buf))]
+            if workers is not None and workers > 1 and path:
+                chunks = plan_chunks(buf, exchange_start, workers)
+            if len(chunks) > 1:
+                profiler.count("chunks", len(chunks))
+                for table in parse_chunks(path, chunks, workers, where):
+                    bonds.extend_table(table)
+            else:
+                bonds.extend(iter_mapped_bonds(buf, exchange_start, where))
+            profiler.count("bonds", len(bonds))
+
+    if cell is None:
+        raise RuntimeError("在 exchange.out 中没有找到 'Cell (Angstrom):' 段。")
+    profiler.count("atom_lines", max(len(atom_lines) - 1, 0))
+    is_soc = soc_in_buffer(buf)
+    profiler.count("soc", is_soc)
+    return ExchangeOut(path=path, cell=cell, atom_lines=atom_lines, is_soc=is_soc, bonds=bonds)
+
+def parse_exchange_out(lines: Iterable[str],
+                       path: str = "",
+                       profiler: Optional[Profiler] = None,
+                       where: Optional[BondFilter] = None,
+                       bonds: Optional[BondTable] = None) -> ExchangeOut:
+    # 读文件、SOC 检测与原子段收集在同一遍扫描中完成, 只有交换段单独计时
+    profiler = get_profiler(profiler)
+    soc, cell, atom_lines, records = scan_exchange_lines(lines, where)
+    if bonds is None:
+        bonds = BondTable()
+    if records is not None:
+        with profiler.stage("exchange_section"):
+            bonds.extend(records)
+            profiler.count("bonds", len(bonds))
+
+    if cell is None:
+        raise RuntimeError("在 exchange.out 中没有找到 'Cell (Angstrom):' 段。")
+    profiler.count("atom_lines", max(len(atom_lines) - 1, 0))
+    profiler.count("soc", soc.is_soc)
+    return ExchangeOut(path=path, cell=cell, atom_lines=atom_lines,
+                       is_soc=soc.is_soc, bonds=bonds)
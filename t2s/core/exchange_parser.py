@@ -1,63 +1,84 @@
-import re
-from typing import List, Dict, Any
-from .lattice_reader import read_lattice_vectors
+from typing import Iterable, Iterator, List, Dict, Any, Optional
+from itertools import chain
+from .lattice_reader import compression_of, iter_lines, scan_header_lines
+from .mapped_reader import iter_mapped_bonds, map_file, scan_header
+from .pushdown import BondFilter, bond_passes, header_passes
+from .tokenizer import parse_bond_header, parse_dmi, parse_j_iso
 
-def parse_exchange_blocks(exchange_path: str) -> List[Dict[str, Any]]:
-    _, _, _, lines = read_lattice_vectors(exchange_path)
+def parse_exchange_blocks(exchange_path: str, where: Optional[BondFilter] = None) -> List[Dict[str, Any]]:
+    if compression_of(exchange_path) is not None:
+        lines = iter_lines(exchange_path)
+        cell, _, exchange_line = scan_header_lines(lines)
+        if cell is None:
+            raise RuntimeError("在 exchange.out 中没有找到 'Cell (Angstrom):' 段。")
+        if exchange_line is None:
+            return []
+        return list(iter_exchange_bonds(chain([exchange_line], lines), where))
+    with map_file(exchange_path) as buf:
+        cell, _, exchange_start = scan_header(buf)
+        if cell is None:
+            raise RuntimeError("在 exchange.out 中没有找到 'Cell (Angstrom):' 段。")
+        if exchange_start is None:
+            return []
+        return list(iter_mapped_bonds(buf, exchange_start, where))
+
+def stream_exchange_bonds(exchange_path: str) -> Iterator[Dict[str, Any]]:
+    return iter_exchange_bonds(iter_lines(exchange_path))
+
+def iter_exchange_bonds(lines: Iterable[str], where: Optional[BondFilter] = None) -> Iterator[Dict[str, Any]]:
+    # where: 解析时丢弃的键 (见 pushdown.make_bond_filter); 键头不满足时整块跳过
     in_exch = False
-    blocks: List[Dict[str, Any]] = []
     cur: Dict[str, Any] = None
+    skipping = False
 
     for line in lines:
-        if line.strip().startswith("Exchange"):
+        s = line.strip()
+        if s.startswith("Exchange"):
             in_exch = True
             continue
         if not in_exch:
             continue
 
-        if line.strip().startswith("----"):
-            if cur:
-                blocks.append(cur)
-                cur = None
+        if s.startswith("----"):
+            if cur and bond_passes(where, cur):
+                yield cur
+            cur = None
+            skipping = False
             continue
 
-        if not line.strip():
+        if not s or skipping:
             continue
 
-        if line.strip().startswith("i") and "J_iso" in line:
+        if s.startswith("i") and "J_iso" in line:
             continue
 
         if cur is None:
-            m = re.match(
-                r"\s*(\S+)\s+(\S+)\s+\(\s*([-\d]+),\s*([-\d]+),\s*([-\d]+)\s*\)\s+"
-                r"([-\d.]+)\s+\(\s*([-\d.]+),\s*([-\d.]+),\s*([-\d.]+)\s*\)\s+([-\d.]+)",
-                line,
-            )
-            if not m:
+            fields = parse_bond_header(line)
+            if fields is None:
+                continue
+            i_label, j_label, R, J_inline, disp, distance = fields
+            if not header_passes(where, i_label, j_label, distance):
+                skipping = True
                 continue
             cur = {
-                "i_label": m.group(1),
-                "j_label": m.group(2),
-                "R": (int(m.group(3)), int(m.group(4)), int(m.group(5))),
-                "J_inline": float(m.group(6)),
-                "disp": (float(m.group(7)), float(m.group(8)), float(m.group(9))),
-                "distance": float(m.group(10)),
+                "i_label": i_label,
+                "j_label": j_label,
+                "R": R,
+                "J_inline": J_inline,
+                "disp": disp,
+                "distance": distance,
                 "J_iso": None,
                 "DMI": (0.0, 0.0, 0.0),
             }
         else:
-            s = line.strip()
             if s.startswith("J_iso:"):
-                try:
-                    cur["J_iso"] = float(s.split()[1])
-                except Exception:
-                    pass
+                J_iso = parse_j_iso(s)
+                if J_iso is not None:
+                    cur["J_iso"] = J_iso
             elif "DMI:" in line:
-                m = re.search(r"DMI:\s*\(\s*([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s*\)", line)
-                if m:
-                    cur["DMI"] = (float(m.group(1)), float(m.group(2)), float(m.group(3)))
-
-    if cur:
-        blocks.append(cur)
+                dmi = parse_dmi(line)
+                if dmi is not None:
+                    cur["DMI"] = dmi
 
-    return blocks
+    if cur and bond_passes(where, cur):
+        yield cur
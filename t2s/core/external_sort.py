@@ -0,0 +1,186 @@
+import heapq, math, os, struct, tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from .bond_table import BondTable
+from .symmetry import _TypeClusters
+
+# 溢出文件中每个键的定长记录: distance, 出现顺序, i, j, R, J, D, DMI (J/D 为 Sunny 约定, 同 BondTable.couplings)
+BOND_RECORD = struct.Struct("<dqii3i5d")
+# 内存中每条缓冲记录 (元组及其中的数值对象) 的估计字节数, 用于把内存预算换算成每段的记录数
+BYTES_PER_RECORD = 320
+DEFAULT_MEMORY_BUDGET = 256 << 20
+# 一次归并同时打开的段数上限; 更多的段先分批归并成更长的段
+MAX_MERGE_RUNS = 64
+# 归并时每个段的读缓冲
+READ_BYTES = 1 << 16
+
+Record = Tuple[Any, ...]
+
+class SpilledBonds:
+    # 按距离外部排序的交换键. 缓冲的键超过 memory_budget 时按 (distance, 出现顺序) 排序写成一个有序段,
+    # merged() 用 heapq.merge 多路归并, 顺序与 BondTable.distance_order 的稳定排序完全一致.
+    # 接口与解析器用到的 BondTable 部分相同 (labels/append/extend/extend_table/len)
+    def __init__(self, memory_budget: int = DEFAULT_MEMORY_BUDGET, spill_dir: Optional[str] = None):
+        if memory_budget <= 0:
+            raise ValueError(f"内存预算必须为正数: {memory_budget}")
+        self.memory_budget = memory_budget
+        self.run_size = max(1, memory_budget // BYTES_PER_RECORD)
+        self.spill_dir = spill_dir
+        self.labels: List[str] = []
+        self._label_index: Dict[str, int] = {}
+        self._buffer: List[Record] = []
+        self._runs: List[str] = []
+        self._tmp: Optional[tempfile.TemporaryDirectory] = None
+        self._count = 0
+
+    def __enter__(self) -> "SpilledBonds":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._buffer = []
+        self._runs = []
+        if self._tmp is not None:
+            self._tmp.cleanup()
+            self._tmp = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def runs(self) -> int:
+        return len(self._runs)
+
+    def intern(self, label: str) -> int:
+        idx = self._label_index.get(label)
+        if idx is None:
+            idx = len(self.labels)
+            self.labels.append(label)
+            self._label_index[label] = idx
+        return idx
+
+    def append(self, bond: Dict[str, Any]) -> None:
+        J_iso = bond["J_iso"]
+        J = -(bond["J_inline"] if J_iso is None or math.isnan(J_iso) else J_iso)
+        Dx, Dy, Dz = bond["DMI"]
+        Rx, Ry, Rz = bond["R"]
+        self._buffer.append((bond["distance"], self._count,
+                             self.intern(bond["i_label"]), self.intern(bond["j_label"]),
+                             Rx, Ry, Rz, J, math.sqrt(Dx*Dx + Dy*Dy + Dz*Dz), Dx, Dy, Dz))
+        self._count += 1
+        if len(self._buffer) >= self.run_size:
+            self._spill()
+
+    def extend(self, bonds: Iterable[Dict[str, Any]]) -> None:
+        for b in bonds:
+            self.append(b)
+
+    def extend_table(self, other: BondTable) -> None:
+        self.extend(other)
+
+    def merged(self) -> Iterator[Record]:
+        # 可以重复调用; 没有溢出时直接在内存中排序
+        self._buffer.sort()
+        if not self._runs:
+            return iter(self._buffer)
+        while len(self._runs) >= MAX_MERGE_RUNS:
+            self._merge_runs(MAX_MERGE_RUNS)
+        return heapq.merge(*(_read_run(path) for path in self._runs), self._buffer)
+
+    def _spill(self) -> None:
+        self._buffer.sort()
+        self._runs.append(self._write_run(self._buffer))
+        self._buffer = []
+
+    def _merge_runs(self, n: int) -> None:
+        group, self._runs = self._runs[:n], self._runs[n:]
+        self._runs.append(self._write_run(heapq.merge(*(_read_run(path) for path in group))))
+        for path in group:
+            os.remove(path)
+
+    def _write_run(self, records: Iterable[Record]) -> str:
+        if self._tmp is None:
+            self._tmp = tempfile.TemporaryDirectory(prefix="t2s-spill-", dir=self.spill_dir)
+        fd, path = tempfile.mkstemp(suffix=".run", dir=self._tmp.name)
+        pack = BOND_RECORD.pack
+        with os.fdopen(fd, "wb", buffering=READ_BYTES) as fh:
+            for rec in records:
+                fh.write(pack(*rec))
+        return path
+
+def _read_run(path: str) -> Iterator[Record]:
+    size = BOND_RECORD.size
+    block = max(1, READ_BYTES // size) * size
+    with open(path, "rb") as fh:
+        while True:
+            data = fh.read(block)
+            if not data:
+                return
+            yield from BOND_RECORD.iter_unpack(data)
+
+def stream_shell_types(records: Iterable[Record],
+                       j_tol: float = 1e-3,
+                       d_tol: float = 1e-3,
+                       dist_tol: float = 1e-3,
+                       max_dist: float = 0.0) -> Iterator[Tuple[int, float, int, Record]]:
+    # 在按距离有序的记录流上一遍完成 group_exchange_shells 的壳层与类型划分, 产出
+    # (壳层序号, 壳层距离, 类型序号, 记录); 序号从 0 开始, 类型按首次出现编号, 与内存中的结果一致.
+    # max_dist > 0 时遇到距离超过它的壳层即停止 (之后的壳层只会更远)
+    shell = -1
+    start = 0.0
+    clusters = None
+    for rec in records:
+        dist = rec[0]
+        if clusters is None or abs(dist - start) > dist_tol:
+            if max_dist > 0.0 and dist > max_dist:
+                return
+            shell += 1
+            start = dist
+            clusters = _TypeClusters(j_tol, d_tol)
+        yield shell, start, clusters.index(rec[7], rec[8]), rec
+
+def summarize_shells(records: Iterable[Record],
+                     j_tol: float = 1e-3,
+                     d_tol: float = 1e-3,
+                     dist_tol: float = 1e-3,
+                     max_dist: float = 0.0) -> List[Dict[str, Any]]:
+    # 壳层与类型的摘要 (不含行号): [{"distance", "types": [{"J", "D", "count"}]}]
+    shells: List[Dict[str, Any]] = []
+    for shell, dist, t, rec in stream_shell_types(records, j_tol, d_tol, dist_tol, max_dist):
+        if shell == len(shells):
+            shells.append({"distance": dist, "types": []})
+        types = shells[shell]["types"]
+        if t == len(types):
+            types.append({"J": rec[7], "D": rec[8], "count": 0})
+        types[t]["count"] += 1
+    return shells
+
+class LineSpool:
+    # 暂存一组输出行, 超过 max_lines 后转存到临时文件; 按写入顺序读回
+    def __init__(self, max_lines: int, spill_dir: Optional[str] = None):
+        self.max_lines = max(1, max_lines)
+        self.spill_dir = spill_dir
+        self._lines: List[str] = []
+        self._fh = None
+
+    def append(self, line: str) -> None:
+        self._lines.append(line)
+        if len(self._lines) >= self.max_lines:
+            if self._fh is None:
+                self._fh = tempfile.TemporaryFile("w+", encoding="utf-8", dir=self.spill_dir)
+            self._fh.writelines(line + "\n" for line in self._lines)
+            self._lines = []
+
+    def __iter__(self) -> Iterator[str]:
+        if self._fh is not None:
+            self._fh.seek(0)
+            for line in self._fh:
+                yield line[:-1]
+        yield from self._lines
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        self._lines = []
@@ -1,9 +1,76 @@
-import math
-from pathlib import Path
-from typing import List, Tuple
+import importlib, math
+from typing import IO, Iterable, Iterator, List, Optional, Tuple
+
+# 压缩格式: (模块, 文件头魔数, 扩展名)
+COMPRESSIONS = {
+    "gzip": ("gzip", b"\x1f\x8b", (".gz",)),
+    "xz": ("lzma", b"\xfd7zXZ\x00", (".xz", ".lzma")),
+    "bz2": ("bz2", b"BZh", (".bz2",)),
+}
+COMPRESSED_SUFFIXES = tuple(ext for _, _, exts in COMPRESSIONS.values() for ext in exts)
+
+def compression_of(exchange_path: str) -> Optional[str]:
+    # 以文件头魔数为准; 文件太短无法判断时才看扩展名
+    with open(exchange_path, "rb") as fh:
+        head = fh.read(6)
+    for name, (_, magic, exts) in COMPRESSIONS.items():
+        if head.startswith(magic):
+            return name
+    if len(head) < 6:
+        for name, (_, _, exts) in COMPRESSIONS.items():
+            if str(exchange_path).endswith(exts):
+                return name
+    return None
+
+def strip_compression_suffix(name: str) -> str:
+    for ext in COMPRESSED_SUFFIXES:
+        if name.endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+def open_text(exchange_path: str) -> IO[str]:
+    # 压缩文件边读边解压, 不写临时文件
+    compression = compression_of(exchange_path)
+    if compression is None:
+        return open(exchange_path, encoding="utf-8", errors="ignore")
+    module_name = COMPRESSIONS[compression][0]
+    try:
+        module = importlib.import_module(module_name)
+    except ImportError:
+        raise RuntimeError(f"当前 Python 不支持 {compression} 压缩 (缺少 {module_name} 模块)。") from None
+    return module.open(exchange_path, "rt", encoding="utf-8", errors="ignore")
 
 def read_lines(exchange_path: str) -> List[str]:
-    return Path(exchange_path).read_text(encoding="utf-8", errors="ignore").splitlines(True)
+    with open_text(exchange_path) as fh:
+        return fh.read().splitlines(True)
+
+def iter_lines(exchange_path: str) -> Iterator[str]:
+    with open_text(exchange_path) as fh:
+        yield from fh
+
+def scan_header_lines(lines: Iterable[str]) -> Tuple[Optional[tuple], List[str], Optional[str]]:
+    # 逐行读取 Exchange 之前的部分; 返回 (cell, atom_lines, Exchange 行), 迭代器停在 Exchange 行之后
+    it = iter(lines)
+    cell = None
+    atom_lines: List[str] = []
+    in_atoms = False
+
+    for line in it:
+        s = line.strip()
+        if in_atoms:
+            if s and not s.startswith("Exchange"):
+                atom_lines.append(line)
+                continue
+            in_atoms = False
+        if cell is None and s.startswith("Cell (Angstrom):"):
+            cell = tuple([float(x) for x in next(it).split()] for _ in range(3))
+        elif not atom_lines and s.startswith("Atoms"):
+            atom_lines.append(line)
+            in_atoms = True
+        elif s.startswith("Exchange"):
+            return cell, atom_lines, line
+
+    return cell, atom_lines, None
 
 def read_lattice_vectors(exchange_path: str) -> Tuple[list, list, list, List[str]]:
     lines = read_lines(exchange_path)
@@ -0,0 +1,201 @@
+import mmap, re
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from .pushdown import BondFilter, bond_passes, header_passes
+from .tokenizer import BOND_HEADER_BYTES_RE, DMI_BYTES_RE
+
+# 与 str.strip() 对应的 ASCII 空白 (换行只出现在行尾)
+_WS = rb"[ \t\r\f\v]*"
+_CELL_RE = re.compile(_WS + rb"Cell \(Angstrom\):")
+_ATOMS_RE = re.compile(_WS + rb"Atoms")
+_EXCHANGE_RE = re.compile(_WS + rb"Exchange")
+_BLANK_RE = re.compile(_WS + rb"$")
+_SEPARATOR_LINE_RE = re.compile(rb"^" + _WS + rb"----", re.MULTILINE)
+_J_ISO_LINE_RE = re.compile(rb"^" + _WS + rb"J_iso:", re.MULTILINE)
+_SKIP_LINE_RE = re.compile(_WS + rb"(?:Exchange|i.*J_iso)")
+_NONCOLLINEAR_RE = re.compile(rb"non-?collinear", re.IGNORECASE)
+
+@contextmanager
+def map_file(exchange_path: str) -> Iterator[Any]:
+    # 只读映射整个文件; 空文件无法 mmap, 返回空 bytes
+    with open(exchange_path, "rb") as fh:
+        try:
+            buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            yield b""
+            return
+        try:
+            yield buf
+        finally:
+            buf.close()
+
+def soc_in_buffer(buf, end: Optional[int] = None) -> bool:
+    # 与 detect_soc 相同的判据, 直接在映射的字节上查找, 不生成小写副本; end 限定只查找 [0, end)
+    if end is None:
+        end = len(buf)
+    for marker in (b"dmi:", b"m(x)", b"m(y)", b"m(z)"):
+        if buf.find(marker, 0, end) >= 0:
+            return True
+    return _NONCOLLINEAR_RE.search(buf, 0, end) is not None
+
+def _line_end(buf, pos: int, size: int) -> Tuple[int, int]:
+    eol = buf.find(b"\n", pos)
+    if eol < 0:
+        return size, size
+    return eol, eol + 1
+
+def _text(buf, start: int, end: int) -> str:
+    return buf[start:end].decode("utf-8", errors="ignore")
+
+def scan_header(buf) -> Tuple[Optional[Tuple[list, list, list]], List[str], Optional[int]]:
+    # 逐行扫描 Exchange 之前的部分 (规则同 parse_exchange_out), 只有晶格与原子行被解码.
+    # 返回 (cell, atom_lines, Exchange 行的偏移)
+    size = len(buf)
+    pos = 0
+    cell = None
+    atom_lines: List[str] = []
+    in_atoms = False
+    while pos < size:
+        eol, nxt = _line_end(buf, pos, size)
+        if in_atoms:
+            if not _BLANK_RE.match(buf, pos, eol) and not _EXCHANGE_RE.match(buf, pos, eol):
+                atom_lines.append(_text(buf, pos, nxt))
+                pos = nxt
+                continue
+            in_atoms = False
+        if cell is None and _CELL_RE.match(buf, pos, eol):
+            vectors = []
+            for _ in range(3):
+                start = nxt
+                _, nxt = _line_end(buf, start, size)
+                vectors.append([float(x) for x in buf[start:nxt].split()])
+            cell = tuple(vectors)
+        elif not atom_lines and _ATOMS_RE.match(buf, pos, eol):
+            atom_lines.append(_text(buf, pos, nxt))
+            in_atoms = True
+        elif _EXCHANGE_RE.match(buf, pos, eol):
+            return cell, atom_lines, pos
+        pos = nxt
+    return cell, atom_lines, None
+
+def _next_header(buf, pos: int, size: int):
+    # 从 pos 开始找下一个键头行, 返回 (match, 键头下一行的偏移); 找不到时 match 为 None
+    while pos < size:
+        eol, nxt = _line_end(buf, pos, size)
+        if _SEPARATOR_LINE_RE.match(buf, pos, eol):
+            pos = nxt
+            continue
+        m = BOND_HEADER_BYTES_RE.match(buf, pos, eol)
+        pos = nxt
+        if m is not None and not _SKIP_LINE_RE.match(buf, m.start(), eol):
+            return m, pos
+    return None, pos
+
+def iter_mapped_bonds(buf,
+                      start: int,
+                      where: Optional[BondFilter] = None,
+                      stop: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    # 与 iter_exchange_bonds 结果一致. 键头之后只定位 J_iso/DMI 行和下一条分隔线,
+    # 其余行 (J_ani 矩阵、[Testing!] 等) 不会被切片或解码; 键头不满足 where 的块直接跳过.
+    # start 所在的一行 (Exchange 行或分隔线) 被跳过; stop 为分隔线的行首时只解析 [start, stop)
+    size = len(buf) if stop is None else stop
+    _, pos = _line_end(buf, start, size)
+    while pos < size:
+        m, pos = _next_header(buf, pos, size)
+        if m is None:
+            return
+        i, j, R0, R1, R2, J, d0, d1, d2, dist = m.groups()
+        cur = {
+            "i_label": i.decode("utf-8", errors="ignore"),
+            "j_label": j.decode("utf-8", errors="ignore"),
+            "R": (int(R0), int(R1), int(R2)),
+            "J_inline": float(J),
+            "disp": (float(d0), float(d1), float(d2)),
+            "distance": float(dist),
+            "J_iso": None,
+            "DMI": (0.0, 0.0, 0.0),
+        }
+
+        sep = _SEPARATOR_LINE_RE.search(buf, pos, size)
+        if not header_passes(where, cur["i_label"], cur["j_label"], cur["distance"]):
+            if sep is None:
+                return
+            _, pos = _line_end(buf, sep.start(), size)
+            continue
+        end = sep.start() if sep is not None else size
+        # 同一个键内多条 J_iso/DMI 行以最后一条能解析的为准, 因此从块尾向前找
+        k = buf.rfind(b"J_iso:", pos, end)
+        while k >= 0:
+            line_start = buf.rfind(b"\n", pos, k) + 1 or pos
+            if _J_ISO_LINE_RE.match(buf, line_start, k + 6):
+                eol, _ = _line_end(buf, k, end)
+                try:
+                    cur["J_iso"] = float(buf[line_start:eol].split()[1])
+                    break
+                except Exception:
+                    pass
+            k = buf.rfind(b"J_iso:", pos, line_start)
+        k = buf.rfind(b"DMI:", pos, end)
+        while k >= 0:
+            line_start = buf.rfind(b"\n", pos, k) + 1 or pos
+            eol, _ = _line_end(buf, k, end)
+            if not _J_ISO_LINE_RE.match(buf, line_start, eol) and not _SKIP_LINE_RE.match(buf, line_start, eol):
+                dm = DMI_BYTES_RE.search(buf, line_start, eol)
+                if dm is not None:
+                    x, y, z = dm.groups()
+                    cur["DMI"] = (float(x), float(y), float(z))
+                    break
+            k = buf.rfind(b"DMI:", pos, line_start)
+
+        if bond_passes(where, cur):
+            yield cur
+        if sep is None:
+            return
+        _, pos = _line_end(buf, sep.start(), size)
+
+def split_exchange(buf, start: int, parts: int) -> List[Tuple[int, int]]:
+    # 把交换段切成 parts 个字节区间, 除第一个外都从分隔线的行首开始.
+    # 任何分隔线之后解析器都处于 "寻找键头" 状态, 因此各区间可以独立解析, 按顺序拼接即为串行结果
+    size = len(buf)
+    bounds = [start]
+    for k in range(1, parts):
+        target = start + (size - start) * k // parts
+        if target <= bounds[-1]:
+            continue
+        m = _SEPARATOR_LINE_RE.search(buf, target)
+        if m is None:
+            break
+        if m.start() > bounds[-1]:
+            bounds.append(m.start())
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def scan_bond_headers(buf, start: int) -> Tuple[int, Optional[float]]:
+    # 只定位键头与分隔线, 统计键数与最大距离; J_iso/DMI 等行不解析
+    size = len(buf)
+    _, pos = _line_end(buf, start, size)
+    count = 0
+    max_distance = None
+    while pos < size:
+        m, pos = _next_header(buf, pos, size)
+        if m is None:
+            break
+        count += 1
+        dist = float(m.group(10))
+        if max_distance is None or dist > max_distance:
+            max_distance = dist
+        sep = _SEPARATOR_LINE_RE.search(buf, pos, size)
+        if sep is None:
+            break
+        _, pos = _line_end(buf, sep.start(), size)
+    return count, max_distance
+
+def first_record_end(buf, start: int) -> int:
+    # 交换段第一条记录 (到其后的分隔线为止) 的结束偏移
+    size = len(buf)
+    _, pos = _line_end(buf, start, size)
+    m, pos = _next_header(buf, pos, size)
+    if m is None:
+        return size
+    sep = _SEPARATOR_LINE_RE.search(buf, pos, size)
+    return sep.start() if sep is not None else size
@@ -0,0 +1,30 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+from .bond_table import BondTable
+from .mapped_reader import iter_mapped_bonds, map_file, split_exchange
+from .pushdown import BondFilter
+
+# 每块至少这么多字节; 更小的交换段不值得启动进程池
+MIN_CHUNK_BYTES = 4 << 20
+# 每个进程分到的块数, 块多一些可以平衡各块耗时的差异
+CHUNKS_PER_WORKER = 4
+
+def plan_chunks(buf, start: int, workers: int,
+                min_chunk: int = MIN_CHUNK_BYTES) -> List[Tuple[int, int]]:
+    parts = min(workers * CHUNKS_PER_WORKER, max(1, (len(buf) - start) // max(min_chunk, 1)))
+    return split_exchange(buf, start, parts)
+
+def _parse_chunk(job: Tuple[str, int, int, Optional[BondFilter]]) -> BondTable:
+    # 子进程各自映射文件 (共享页缓存), 只把列式的 BondTable 传回
+    exchange_path, lo, hi, where = job
+    with map_file(exchange_path) as buf:
+        return BondTable.from_bonds(iter_mapped_bonds(buf, lo, where, hi))
+
+def parse_chunks(exchange_path: str,
+                 chunks: List[Tuple[int, int]],
+                 workers: int,
+                 where: Optional[BondFilter] = None) -> Iterator[BondTable]:
+    # 按 chunks 的顺序产出各块的 BondTable, 依次 extend_table 即得到与串行解析相同的表
+    jobs = [(exchange_path, lo, hi, where) for lo, hi in chunks]
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(jobs)))) as pool:
+        yield from pool.map(_parse_chunk, jobs)
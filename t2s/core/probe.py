@@ -0,0 +1,60 @@
+import os
+from typing import Any, Dict
+from .atom_parser import parse_atom_lines
+from .exchange_out import scan_exchange_lines
+from .lattice_reader import cell_params_from_vectors, compression_of, iter_lines
+from .mapped_reader import first_record_end, map_file, scan_bond_headers, scan_header, soc_in_buffer
+
+def probe_exchange_out(exchange_path: str,
+                       mag_threshold: float = 0.5,
+                       count_bonds: bool = False) -> Dict[str, Any]:
+    # 只读取 Exchange 之前的部分和交换段的第一条记录; SOC 按 detect_soc 的标记在这段范围内判断.
+    # count_bonds=True 时再扫描整个交换段统计键数与最大距离 (只看键头), SOC 判断覆盖整个文件
+    info: Dict[str, Any] = {
+        "path": str(exchange_path),
+        "compression": compression_of(exchange_path),
+        "bytes": os.path.getsize(exchange_path),
+    }
+    bonds = 0 if count_bonds else None
+    max_distance = None
+    if info["compression"] is not None:
+        lines = iter_lines(exchange_path)
+        try:
+            soc, cell, atom_lines, records = scan_exchange_lines(lines)
+            if records is not None:
+                if count_bonds:
+                    for bond in records:
+                        bonds += 1
+                        if max_distance is None or bond["distance"] > max_distance:
+                            max_distance = bond["distance"]
+                else:
+                    next(records, None)
+            is_soc = soc.is_soc
+        finally:
+            lines.close()
+    else:
+        with map_file(exchange_path) as buf:
+            cell, atom_lines, exchange_start = scan_header(buf)
+            if count_bonds:
+                is_soc = soc_in_buffer(buf)
+                if exchange_start is not None:
+                    bonds, max_distance = scan_bond_headers(buf, exchange_start)
+            else:
+                end = len(buf) if exchange_start is None else first_record_end(buf, exchange_start)
+                is_soc = soc_in_buffer(buf, end)
+    if cell is None:
+        raise RuntimeError("在 exchange.out 中没有找到 'Cell (Angstrom):' 段。")
+
+    a, b, c, alpha, beta, gamma = cell_params_from_vectors(*cell)
+    atoms = parse_atom_lines(atom_lines, cell, mag_threshold=0.0, is_soc=is_soc)
+    magnetic = [atom for atom in atoms if atom["moment"] >= mag_threshold]
+    info.update(
+        a=a, b=b, c=c, alpha=alpha, beta=beta, gamma=gamma,
+        soc=is_soc,
+        atoms=len(atoms),
+        magnetic_atoms=[{"label": atom["label"], "element": atom["element"],
+                         "moment": atom["moment"], "mvec": atom["mvec"]} for atom in magnetic],
+        bonds=bonds,
+        max_distance=max_distance,
+    )
+    return info
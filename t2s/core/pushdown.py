@@ -0,0 +1,53 @@
+import math
+from typing import Any, Dict, Iterable, Optional
+from .bond_table import BondTable
+
+BondFilter = Dict[str, Any]
+
+def make_bond_filter(max_dist: float = 0.0,
+                     dist_tol: float = 1e-3,
+                     min_exchange: Optional[float] = None,
+                     pair_labels: Optional[Iterable[str]] = None) -> Optional[BondFilter]:
+    # 解析时丢弃的键. 距离截断是精确的: 壳层以最近的键为起点, 起点 <= max_dist 的壳层中
+    # 所有键的距离都不超过 max_dist + dist_tol, 更远的键只会落入被丢弃的壳层.
+    # min_exchange (按单个键判断) 与 pair_labels 会改变类型聚类, 只在显式要求时使用
+    where: BondFilter = {"max_distance": None, "min_exchange": min_exchange, "labels": None}
+    if max_dist > 0.0 and dist_tol >= 0.0:
+        # 留一点余量, 避免浮点舍入误删壳层内的键; 多保留的键不影响结果
+        cutoff = max_dist + dist_tol
+        where["max_distance"] = cutoff + 1e-9 * max(1.0, abs(cutoff))
+    if pair_labels is not None:
+        where["labels"] = frozenset(pair_labels)
+    if all(v is None for v in where.values()):
+        return None
+    return where
+
+def header_passes(where: Optional[BondFilter], i_label: str, j_label: str, distance: float) -> bool:
+    if where is None:
+        return True
+    max_distance = where["max_distance"]
+    if max_distance is not None and distance > max_distance:
+        return False
+    labels = where["labels"]
+    return labels is None or (i_label in labels and j_label in labels)
+
+def bond_passes(where: Optional[BondFilter], bond: Dict[str, Any]) -> bool:
+    # 与 min_exchange 的类型过滤同一判据: |J| 与 |D| 都不超过阈值时丢弃
+    if where is None or where["min_exchange"] is None:
+        return True
+    threshold = where["min_exchange"]
+    J = bond["J_inline"] if bond["J_iso"] is None else bond["J_iso"]
+    Dx, Dy, Dz = bond["DMI"]
+    return abs(J) > threshold or math.sqrt(Dx*Dx + Dy*Dy + Dz*Dz) > threshold
+
+def filter_table(table: BondTable, where: Optional[BondFilter]) -> BondTable:
+    # 用于已解析的模型 (例如来自解析缓存)
+    if where is None:
+        return table
+    rows = [k for k in range(len(table))
+            if header_passes(where, table.labels[table.i[k]], table.labels[table.j[k]],
+                             table.distance[k])
+            and bond_passes(where, table[k])]
+    if len(rows) == len(table):
+        return table
+    return BondTable.from_bonds(table[k] for k in rows)
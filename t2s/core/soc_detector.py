@@ -1,19 +1,29 @@
-from pathlib import Path
+from .lattice_reader import compression_of, iter_lines
+from .mapped_reader import map_file, soc_in_buffer
 
 def detect_soc(exchange_path: str = "exchange.out") -> bool:
-    txt = Path(exchange_path).read_text(encoding="utf-8", errors="ignore")
-    lower = txt.lower()
+    # 只有 SOC 标记 (non-collinear、dmi:、m(x/y/z)) 会得到 True, 其余情况均为 collinear
+    if compression_of(exchange_path) is not None:
+        scanner = SocScanner()
+        for line in iter_lines(exchange_path):
+            scanner.feed(line)
+            if scanner.is_soc:
+                break
+        return scanner.is_soc
+    with map_file(exchange_path) as buf:
+        return soc_in_buffer(buf)
 
-    if "non-collinear" in lower or "noncollinear" in lower:
-        return True
-    if "dmi:" in txt:
-        return True
-    if "m(x)" in txt or "m(y)" in txt or "m(z)" in txt:
-        return True
+class SocScanner:
+    # 逐行版本的 detect_soc: 只有 SOC 标记会改变结果, 命中后不再检查后续行
+    def __init__(self):
+        self.is_soc = False
 
-    if "collinear" in lower:
-        return False
-    if "w_magmom" in txt:
-        return False
-
-    return False
+    def feed(self, line: str) -> None:
+        if self.is_soc:
+            return
+        if "dmi:" in line or "m(x)" in line or "m(y)" in line or "m(z)" in line:
+            self.is_soc = True
+            return
+        lower = line.lower()
+        if "non-collinear" in lower or "noncollinear" in lower:
+            self.is_soc = True
@@ -0,0 +1,152 @@
+import itertools, math
+from array import array
+from typing import Any, Dict, List, Sequence, Tuple
+from .lattice_reader import invert_3x3
+
+# 对称操作: 分数坐标下 f' = W f + t; perm/shifts 满足 W f_a + t = f_perm[a] + shifts[a]
+SymOp = Tuple[tuple, tuple, List[int], List[tuple]]
+
+def find_symmetry_ops(cell,
+                      positions: Sequence[Sequence[float]],
+                      types: Sequence[str],
+                      symprec: float = 1e-3) -> List[SymOp]:
+    A = [list(v) for v in cell]
+    G = [[sum(A[i][k] * A[j][k] for k in range(3)) for j in range(3)] for i in range(3)]
+    lmax = math.sqrt(max(G[i][i] for i in range(3)))
+    gtol = 2.0 * symprec * lmax + symprec * symprec
+
+    def metric(u, v):
+        return sum(u[i] * G[i][j] * v[j] for i in range(3) for j in range(3))
+
+    vectors = [v for v in itertools.product((-1, 0, 1), repeat=3) if any(v)]
+    columns = [[v for v in vectors if abs(metric(v, v) - G[k][k]) <= gtol] for k in range(3)]
+
+    ops: List[SymOp] = []
+    n = len(positions)
+    for c0, c1, c2 in itertools.product(*columns):
+        cols = (c0, c1, c2)
+        if any(abs(metric(cols[k], cols[l]) - G[k][l]) > gtol for k in range(3) for l in range(k + 1, 3)):
+            continue
+        W = tuple(tuple(cols[k][i] for k in range(3)) for i in range(3))
+        if abs(_det(W)) != 1:
+            continue
+        if n == 0:
+            ops.append((W, (0.0, 0.0, 0.0), [], []))
+            continue
+        images = [_apply(W, f) for f in positions]
+        for b in range(n):
+            if types[b] != types[0]:
+                continue
+            t = tuple(positions[b][k] - images[0][k] for k in range(3))
+            mapped = _map_atoms(A, images, t, positions, types, symprec)
+            if mapped is not None:
+                t = tuple(x - math.floor(x + 0.5 * symprec) for x in t)
+                perm = mapped
+                shifts = [tuple(round(images[a][k] + t[k] - positions[perm[a]][k]) for k in range(3))
+                          for a in range(n)]
+                ops.append((W, t, perm, shifts))
+    return ops
+
+def _map_atoms(A, images, t, positions, types, symprec):
+    perm: List[int] = []
+    used = set()
+    for a, p in enumerate(images):
+        hit = None
+        for b, f in enumerate(positions):
+            if b in used or types[b] != types[a]:
+                continue
+            d = [p[k] + t[k] - f[k] for k in range(3)]
+            d = [x - round(x) for x in d]
+            r = [sum(d[k] * A[k][i] for k in range(3)) for i in range(3)]
+            if math.sqrt(sum(x * x for x in r)) <= symprec:
+                hit = b
+                break
+        if hit is None:
+            return None
+        used.add(hit)
+        perm.append(hit)
+    return perm
+
+def _apply(W, v):
+    return tuple(sum(W[i][k] * v[k] for k in range(3)) for i in range(3))
+
+def _det(M):
+    return (M[0][0] * (M[1][1] * M[2][2] - M[1][2] * M[2][1])
+            - M[0][1] * (M[1][0] * M[2][2] - M[1][2] * M[2][0])
+            + M[0][2] * (M[1][0] * M[2][1] - M[1][1] * M[2][0]))
+
+def cartesian_rotation(cell, W) -> List[List[float]]:
+    # 分数坐标 r = M f (M 的列为晶格矢量), 因此笛卡尔转动为 M W M^-1
+    M = [[cell[k][i] for k in range(3)] for i in range(3)]
+    Minv = invert_3x3(*cell)
+    MW = [[sum(M[i][k] * W[k][j] for k in range(3)) for j in range(3)] for i in range(3)]
+    return [[sum(MW[i][k] * Minv[k][j] for k in range(3)) for j in range(3)] for i in range(3)]
+
+def reduce_symmetric_bonds(shells: List[Dict[str, Any]],
+                           table,
+                           atoms: List[Dict[str, Any]],
+                           cell,
+                           j_tol: float = 1e-3,
+                           d_tol: float = 1e-3,
+                           use_dmi: bool = True,
+                           symprec: float = 1e-3) -> None:
+    # Sunny 的 set_exchange! 会把耦合传播到所有对称等价键, 因此每个等价类只保留第一个键.
+    # 同时检查等价键上的 TB2J 耦合在 j_tol/d_tol 内一致 (DMI 作为轴矢量变换)
+    ops = find_symmetry_ops(cell, [a['frac'] for a in atoms], [a['element'] for a in atoms], symprec)
+    label_atom = {a['label']: n for n, a in enumerate(atoms)}
+    atom_of = [label_atom.get(label) for label in table.labels]
+    rotations = [(cartesian_rotation(cell, W), _det(W)) for W, _, _, _ in ops]
+    J_all, _ = table.couplings()
+
+    def key_of(k):
+        return (atom_of[table.i[k]], atom_of[table.j[k]], tuple(table.R[3*k:3*k + 3]))
+
+    emitted = []
+    index: Dict[tuple, int] = {}
+    for shell in shells:
+        for t in shell['types']:
+            for k in t['rows']:
+                a, b, R = key_of(k)
+                if a is None or b is None:
+                    continue
+                emitted.append(k)
+                index.setdefault((a, b, R), k)
+
+    redundant = set()
+    for k in emitted:
+        if k in redundant:
+            continue
+        a, b, R = key_of(k)
+        D = table.DMI[3*k:3*k + 3]
+        for (W, _, perm, shifts), (Rc, det) in zip(ops, rotations):
+            Rimg = tuple(shifts[b][x] + sum(W[x][y] * R[y] for y in range(3)) - shifts[a][x]
+                         for x in range(3))
+            # (i, j, R) 与 (j, i, -R) 是同一个键, 反向时 DMI 变号
+            for image, sign in (((perm[a], perm[b], Rimg), 1.0),
+                                ((perm[b], perm[a], tuple(-x for x in Rimg)), -1.0)):
+                m = index.get(image)
+                if m is None:
+                    continue
+                _check_equivalent(table, k, m, J_all, D, Rc, det * sign, j_tol, d_tol, use_dmi)
+                if m != k:
+                    redundant.add(m)
+
+    for shell in shells:
+        for t in shell['types']:
+            t['rows'] = array("q", (k for k in t['rows'] if k not in redundant))
+
+def _check_equivalent(table, k, m, J_all, D, Rc, factor, j_tol, d_tol, use_dmi):
+    dJ = abs(J_all[k] - J_all[m])
+    dD = 0.0
+    if use_dmi:
+        expected = [factor * sum(Rc[x][y] * D[y] for y in range(3)) for x in range(3)]
+        actual = table.DMI[3*m:3*m + 3]
+        dD = math.sqrt(sum((e - v) ** 2 for e, v in zip(expected, actual)))
+    if dJ > j_tol or dD > d_tol:
+        def describe(n):
+            R = tuple(table.R[3*n:3*n + 3])
+            return f"{table.labels[table.i[n]]}-{table.labels[table.j[n]]} R={R}"
+        raise ValueError(
+            f"对称等价的键耦合不一致: {describe(k)} 与 {describe(m)} "
+            f"(ΔJ={dJ:.6f}, ΔD={dD:.6f})。请放宽 --j-tol/--d-tol 或关闭 --symmetry-reduce。"
+        )
@@ -1,36 +1,164 @@
 import math
-from typing import List, Dict, Any
+from array import array
+from typing import List, Dict, Any, Optional, Sequence, Union
+from .bond_table import BondRows, BondTable, np, _want_numpy
 
-def group_exchange_shells(blocks: List[Dict[str, Any]],
+# 超过该数量的壳层在有 numpy 时走向量化去重路径
+NUMPY_CLUSTER_MIN = 4096
+
+def group_exchange_shells(blocks: Union[BondTable, List[Dict[str, Any]]],
                           j_tol: float = 1e-3,
                           d_tol: float = 1e-3,
-                          dist_tol: float = 1e-3):
-    blocks_sorted = sorted(blocks, key=lambda b: b["distance"])
-    shells = []
+                          dist_tol: float = 1e-3,
+                          use_numpy: Optional[bool] = None):
+    table = blocks if isinstance(blocks, BondTable) else BondTable.from_bonds(blocks)
+    shells = group_distance_shells(table, dist_tol=dist_tol, use_numpy=use_numpy)
+    return cluster_shell_types(shells, table, j_tol=j_tol, d_tol=d_tol, use_numpy=use_numpy)
+
+def group_distance_shells(table: BondTable,
+                          dist_tol: float = 1e-3,
+                          use_numpy: Optional[bool] = None,
+                          order: Optional[Sequence[int]] = None) -> List[Dict[str, Any]]:
+    # 只按距离分壳层; 排序结果与 dist_tol 无关, 可以通过 order 复用
+    distance = table.distance
+    shells: List[Dict[str, Any]] = []
 
-    for b in blocks_sorted:
-        dist = b["distance"]
+    for k in (table.distance_order(use_numpy) if order is None else order):
+        dist = distance[k]
         if not shells or abs(dist - shells[-1]["distance"]) > dist_tol:
-            shells.append({"distance": dist, "blocks": []})
-        shells[-1]["blocks"].append(b)
+            shells.append({"distance": dist, "rows": array("q")})
+        shells[-1]["rows"].append(k)
+
+    return shells
 
+def cluster_shell_types(shells: List[Dict[str, Any]],
+                        table: BondTable,
+                        j_tol: float = 1e-3,
+                        d_tol: float = 1e-3,
+                        use_numpy: Optional[bool] = None) -> List[Dict[str, Any]]:
+    # 返回新的壳层列表, 不修改传入的距离壳层, 以便对不同的 j_tol/d_tol 复用.
+    # 壳层与类型用 "rows" 记录行号; "blocks"/"bonds" 是按需读成键字典的视图, 与原来的列表形式兼容
+    J_all, D_all = table.couplings(use_numpy)
+    grouped = []
     for shell in shells:
-        types = []
-        for b in shell["blocks"]:
-            J_tb2j = b["J_iso"] if b["J_iso"] is not None else b["J_inline"]
-            J = -J_tb2j
-            Dx, Dy, Dz = b["DMI"]
-            D = math.sqrt(Dx*Dx + Dy*Dy + Dz*Dz)
-
-            found = None
-            for t in types:
-                if abs(J - t["J"]) <= j_tol and abs(D - t["D"]) <= d_tol:
-                    found = t
-                    break
-            if found is None:
-                found = {"J": J, "D": D, "bonds": []}
-                types.append(found)
-            found["bonds"].append(b)
-        shell["types"] = types
+        types = cluster_types(shell["rows"], J_all, D_all,
+                              j_tol=j_tol, d_tol=d_tol, use_numpy=use_numpy)
+        for t in types:
+            t["bonds"] = BondRows(table, t["rows"])
+        grouped.append({"distance": shell["distance"],
+                        "rows": shell["rows"],
+                        "blocks": BondRows(table, shell["rows"]),
+                        "types": types})
+    return grouped
 
-    return shells
+def cluster_types(rows: Sequence[int],
+                  J_all: Sequence[float],
+                  D_all: Sequence[float],
+                  j_tol: float = 1e-3,
+                  d_tol: float = 1e-3,
+                  use_numpy: Optional[bool] = None) -> List[Dict[str, Any]]:
+    # 与逐个线性扫描完全一致: 每个键归入第一个 |ΔJ| <= j_tol 且 |ΔD| <= d_tol 的类型
+    if use_numpy is None:
+        use_numpy = np is not None and len(rows) >= NUMPY_CLUSTER_MIN
+    if _want_numpy(use_numpy):
+        types = _cluster_types_numpy(rows, J_all, D_all, j_tol, d_tol)
+        if types is not None:
+            return types
+
+    clusters = _TypeClusters(j_tol, d_tol)
+    for k in rows:
+        clusters.assign(J_all[k], D_all[k]).append(k)
+    return clusters.types
+
+class _TypeClusters:
+    # 按 (J, D) 量化分桶, 只检查相邻桶; 桶宽取 2*tol, 保证容差范围落在 ±1 个桶内
+    def __init__(self, j_tol: float, d_tol: float):
+        self.j_tol = j_tol
+        self.d_tol = d_tol
+        self.types: List[Dict[str, Any]] = []
+        self._buckets: Dict[tuple, List[int]] = {}
+        # J/D 有限但无法分桶的类型, 每次查找都要检查
+        self._unbucketed: List[int] = []
+        self._exact: Optional[Dict[tuple, int]] = {} if j_tol >= 0 and d_tol >= 0 else None
+
+    def assign(self, J: float, D: float) -> array:
+        return self.types[self.index(J, D)]["rows"]
+
+    def index(self, J: float, D: float) -> int:
+        # 返回 (J, D) 所属类型的序号, 必要时新建类型
+        exact = self._exact
+        if exact is not None:
+            idx = exact.get((J, D))
+            if idx is not None:
+                return idx
+
+        idx = None
+        key = None
+        if self._exact is not None and math.isfinite(J) and math.isfinite(D):
+            kj = _bucket(J, self.j_tol)
+            kd = _bucket(D, self.d_tol)
+            if kj is None or kd is None:
+                # 容差过小, x / tol 溢出: 逐个比较所有类型
+                groups = [range(len(self.types))]
+            else:
+                key = (kj, kd)
+                groups = [self._buckets.get((qj, qd), ())
+                          for qj in _neighbours(kj, self.j_tol)
+                          for qd in _neighbours(kd, self.d_tol)]
+                groups.append(self._unbucketed)
+            for group in groups:
+                for cand in group:
+                    if idx is not None and cand >= idx:
+                        break
+                    t = self.types[cand]
+                    if abs(J - t["J"]) <= self.j_tol and abs(D - t["D"]) <= self.d_tol:
+                        idx = cand
+                        break
+
+        if idx is None:
+            idx = len(self.types)
+            self.types.append({"J": J, "D": D, "rows": array("q")})
+            if key is not None:
+                self._buckets.setdefault(key, []).append(idx)
+            elif self._exact is not None and math.isfinite(J) and math.isfinite(D):
+                self._unbucketed.append(idx)
+        if exact is not None:
+            exact[(J, D)] = idx
+        return idx
+
+def _bucket(x: float, tol: float):
+    # 商不是有限值时返回 None, 此时无法分桶
+    if tol <= 0:
+        return x
+    q = x / (2.0 * tol)
+    return math.floor(q) if math.isfinite(q) else None
+
+def _neighbours(q, tol: float):
+    return (q - 1, q, q + 1) if tol > 0 else (q,)
+
+def _cluster_types_numpy(rows, J_all, D_all, j_tol, d_tol):
+    rows_np = np.asarray(rows, dtype=np.int64)
+    J = np.asarray(J_all, dtype=np.float64)[rows_np]
+    D = np.asarray(D_all, dtype=np.float64)[rows_np]
+    if j_tol < 0 or d_tol < 0 or not (np.isfinite(J).all() and np.isfinite(D).all()):
+        return None
+
+    # 相同 (J, D) 的键必然落入同一类型, 只需对去重后的值按首次出现顺序聚类
+    pairs = np.stack([J, D], axis=1)
+    _, first, inverse = np.unique(pairs, axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    order = np.argsort(first, kind="stable")
+    clusters = _TypeClusters(j_tol, d_tol)
+    type_of_unique = np.empty(len(first), dtype=np.int64)
+    for u in order.tolist():
+        k = int(first[u])
+        type_of_unique[u] = clusters.index(float(J[k]), float(D[k]))
+
+    type_of_row = type_of_unique[inverse]
+    by_type = np.argsort(type_of_row, kind="stable")
+    counts = np.bincount(type_of_row, minlength=len(clusters.types))
+    start = 0
+    for t, n in zip(clusters.types, counts.tolist()):
+        t["rows"] = array("q", rows_np[by_type[start:start + n]].tobytes())
+        start += n
+    return clusters.types
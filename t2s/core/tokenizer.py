@@ -0,0 +1,39 @@
+import re
+from typing import Optional, Tuple
+
+# 预编译的模式; 对每个候选行只做一次匹配, 分组结果一次性解包
+BOND_HEADER_RE = re.compile(
+    r"\s*(\S+)\s+(\S+)\s+\(\s*([-\d]+),\s*([-\d]+),\s*([-\d]+)\s*\)\s+"
+    r"([-\d.]+)\s+\(\s*([-\d.]+),\s*([-\d.]+),\s*([-\d.]+)\s*\)\s+([-\d.]+)"
+)
+DMI_RE = re.compile(r"DMI:\s*\(\s*([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s*\)")
+ELEMENT_RE = re.compile(r"[A-Za-z]+")
+# 同样的模式用于 mmap 缓冲区 (mapped_reader)
+BOND_HEADER_BYTES_RE = re.compile(BOND_HEADER_RE.pattern.encode())
+DMI_BYTES_RE = re.compile(DMI_RE.pattern.encode())
+
+_match_header = BOND_HEADER_RE.match
+_search_dmi = DMI_RE.search
+
+BondHeader = Tuple[str, str, Tuple[int, int, int], float, Tuple[float, float, float], float]
+
+def parse_bond_header(line: str) -> Optional[BondHeader]:
+    m = _match_header(line)
+    if m is None:
+        return None
+    i, j, R0, R1, R2, J, d0, d1, d2, dist = m.groups()
+    return (i, j, (int(R0), int(R1), int(R2)), float(J),
+            (float(d0), float(d1), float(d2)), float(dist))
+
+def parse_j_iso(stripped: str) -> Optional[float]:
+    try:
+        return float(stripped.split()[1])
+    except Exception:
+        return None
+
+def parse_dmi(line: str) -> Optional[Tuple[float, float, float]]:
+    m = _search_dmi(line)
+    if m is None:
+        return None
+    x, y, z = m.groups()
+    return float(x), float(y), float(z)
@@ -1,11 +1,18 @@
-from typing import Optional, List
-from ..core.atom_parser import parse_magnetic_atoms
+from typing import Any, Dict, Optional, List
+from ..core.exchange_out import ExchangeOut
+from .writer import LineWriter, render_block
 
-def make_sunny_atoms_block(exchange_path: str,
-                           mag_threshold: float = 0.5,
-                           is_soc: Optional[bool] = None,
-                           spins: Optional[List[str]] = None) -> str:
-    atoms = parse_magnetic_atoms(exchange_path, mag_threshold, is_soc=is_soc)
+ALLOWED_SPINS = {"1/2", "1", "3/2", "2", "2/5", "3", "2/7"}
+
+def check_spin_value(value: str) -> str:
+    # 命令行与 t2s serve 共用的 S 取值检查
+    if not isinstance(value, str) or value not in ALLOWED_SPINS:
+        raise ValueError(
+            f"不支持的 S 值: {value}. 允许的值: {', '.join(sorted(ALLOWED_SPINS))}."
+        )
+    return value
+
+def check_spins(atoms: List[Dict[str, Any]], spins: Optional[List[str]]) -> None:
     if spins is None:
         labels = ", ".join(a["label"] for a in atoms)
         raise ValueError(
@@ -18,23 +25,43 @@ def make_sunny_atoms_block(exchange_path: str,
             "指定的 S 数量与磁性原子数量不一致。"
             f"磁性原子顺序: {labels}."
         )
-    lines = []
-    lines.append("# Magnetic atoms (fractional coordinates)")
-    lines.append("positions = [")
+
+def make_sunny_atoms_block(model: ExchangeOut,
+                           mag_threshold: float = 0.5,
+                           is_soc: Optional[bool] = None,
+                           spins: Optional[List[str]] = None,
+                           symprec: Optional[float] = None) -> str:
+    return render_block(write_sunny_atoms_block, model,
+                        mag_threshold=mag_threshold, is_soc=is_soc, spins=spins,
+                        symprec=symprec)
+
+def write_sunny_atoms_block(model: ExchangeOut,
+                            out: LineWriter,
+                            mag_threshold: float = 0.5,
+                            is_soc: Optional[bool] = None,
+                            spins: Optional[List[str]] = None,
+                            symprec: Optional[float] = None) -> None:
+    atoms = model.magnetic_atoms(mag_threshold, is_soc=is_soc)
+    check_spins(atoms, spins)
+    out.line("# Magnetic atoms (fractional coordinates)")
+    out.line("positions = [")
     for a in atoms:
         fx, fy, fz = a['frac']
-        lines.append(f"    [{fx:.8f}, {fy:.8f}, {fz:.8f}],  # {a['label']} ({a['element']})")
-    lines.append("]\n")
+        out.line(f"    [{fx:.8f}, {fy:.8f}, {fz:.8f}],  # {a['label']} ({a['element']})")
+    out.line("]\n")
 
-    lines.append("types = [")
+    out.line("types = [")
     for a in atoms:
-        lines.append(f"    \"{a['element']}\",")
-    lines.append("]\n")
+        out.line(f"    \"{a['element']}\",")
+    out.line("]\n")
 
-    lines.append("cryst = Crystal(latvecs, positions, 1; types=types)\n")
-    lines.append("moments = [")
+    if symprec is None:
+        out.line("cryst = Crystal(latvecs, positions, 1; types=types)\n")
+    else:
+        # 让 Sunny 推断空间群, set_exchange! 才会把耦合传播到等价键
+        out.line(f"cryst = Crystal(latvecs, positions; types=types, symprec={symprec:g})\n")
+    out.line("moments = [")
     for i, spin in enumerate(spins):
-        lines.append(f"    {i+1} => Moment(s={spin}, g=2),")
-    lines.append("]\n")
-    lines.append("sys = System(cryst, moments, :dipole)")
-    return "\n".join(lines)
+        out.line(f"    {i+1} => Moment(s={spin}, g=2),")
+    out.line("]\n")
+    out.line("sys = System(cryst, moments, :dipole)")
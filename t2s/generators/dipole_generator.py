@@ -1,12 +1,20 @@
 import math
 from typing import Optional
-from ..core.atom_parser import parse_magnetic_atoms
+from ..core.exchange_out import ExchangeOut
+from .writer import LineWriter, render_block
 
-def make_sunny_dipole_block(exchange_path: str,
+def make_sunny_dipole_block(model: ExchangeOut,
                             mag_threshold: float = 0.5,
                             is_soc: Optional[bool] = None) -> str:
-    atoms = parse_magnetic_atoms(exchange_path, mag_threshold, is_soc=is_soc)
-    lines = ["# Initialize spins according to TB2J magnetic moments"]
+    return render_block(write_sunny_dipole_block, model,
+                        mag_threshold=mag_threshold, is_soc=is_soc)
+
+def write_sunny_dipole_block(model: ExchangeOut,
+                             out: LineWriter,
+                             mag_threshold: float = 0.5,
+                             is_soc: Optional[bool] = None) -> None:
+    atoms = model.magnetic_atoms(mag_threshold, is_soc=is_soc)
+    out.line("# Initialize spins according to TB2J magnetic moments")
     for i, a in enumerate(atoms, 1):
         mx, my, mz = a['mvec']
         m = math.sqrt(mx*mx + my*my + mz*mz)
@@ -14,7 +22,6 @@ def make_sunny_dipole_block(exchange_path: str,
             ux, uy, uz = mx/m, my/m, mz/m
         else:
             ux, uy, uz = 0.0, 0.0, 1.0
-        lines.append(
+        out.line(
             f"set_dipole!(sys, [{ux:.6f}, {uy:.6f}, {uz:.6f}], ({i},))"
         )
-    return "\n".join(lines)
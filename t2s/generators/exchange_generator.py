@@ -1,11 +1,21 @@
 import math, string
+from array import array
 from fractions import Fraction
-from typing import List, Optional
-from ..core.atom_parser import parse_magnetic_atoms
-from ..core.exchange_parser import parse_exchange_blocks
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from ..core.exchange_out import ExchangeOut
+from ..core.external_sort import (BYTES_PER_RECORD, LineSpool, SpilledBonds, stream_shell_types,
+                                  summarize_shells)
+from ..core.spacegroup import reduce_symmetric_bonds
 from ..core.symmetry import group_exchange_shells
+from ..profiling import Profiler, get_profiler
+from .atom_generator import check_spins
+from .writer import LineWriter, render_block
 
-def make_sunny_exchange_block(exchange_path: str,
+EXCHANGE_FORMATS = ("bonds", "arrays")
+# arrays 格式中每行写出的数组元素个数
+ARRAY_ITEMS_PER_LINE = 16
+
+def make_sunny_exchange_block(model: ExchangeOut,
                               mag_threshold: float = 0.5,
                               j_tol: float = 1e-3,
                               d_tol: float = 1e-3,
@@ -13,80 +23,374 @@ def make_sunny_exchange_block(exchange_path: str,
                               max_dist: float = 0.0,
                               min_exchange: float = 1e-3,
                               use_dmi: bool = True,
-                              spins: Optional[List[str]] = None) -> str:
-    atoms = parse_magnetic_atoms(exchange_path, mag_threshold, is_soc=use_dmi)
-    if spins is None:
-        labels = ", ".join(a["label"] for a in atoms)
-        raise ValueError(
-            "必须为每个磁性原子指定 S 值。"
-            f"磁性原子顺序: {labels}."
-        )
-    if len(spins) != len(atoms):
-        labels = ", ".join(a["label"] for a in atoms)
-        raise ValueError(
-            "指定的 S 数量与磁性原子数量不一致。"
-            f"磁性原子顺序: {labels}."
-        )
+                              spins: Optional[List[str]] = None,
+                              exchange_format: str = "bonds",
+                              symprec: Optional[float] = None) -> str:
+    return render_block(write_sunny_exchange_block, model,
+                        mag_threshold=mag_threshold,
+                        j_tol=j_tol, d_tol=d_tol, dist_tol=dist_tol,
+                        max_dist=max_dist, min_exchange=min_exchange,
+                        use_dmi=use_dmi, spins=spins,
+                        exchange_format=exchange_format,
+                        symprec=symprec)
+
+def write_sunny_exchange_block(model: ExchangeOut,
+                               out: LineWriter,
+                               mag_threshold: float = 0.5,
+                               j_tol: float = 1e-3,
+                               d_tol: float = 1e-3,
+                               dist_tol: float = 1e-3,
+                               max_dist: float = 0.0,
+                               min_exchange: float = 1e-3,
+                               use_dmi: bool = True,
+                               spins: Optional[List[str]] = None,
+                               exchange_format: str = "bonds",
+                               symprec: Optional[float] = None,
+                               profiler: Optional[Profiler] = None,
+                               grouped_shells: Optional[List[Dict[str, Any]]] = None,
+                               selected_shells: Optional[List[Dict[str, Any]]] = None) -> None:
+    # grouped_shells: 已按 (dist_tol, j_tol, d_tol) 分好组的壳层 (参数扫描时复用), 不会被修改.
+    # selected_shells: 事先用 select_exchange_shells 以相同参数得到的结果, 给出时直接写出
+    profiler = get_profiler(profiler)
+    check_exchange_format(exchange_format)
+    atoms = model.magnetic_atoms(mag_threshold, is_soc=use_dmi)
+    check_spins(atoms, spins)
     spin_values = [float(Fraction(s)) for s in spins]
     label_to_index = {a['label']: i+1 for i,a in enumerate(atoms)}
-    blocks = parse_exchange_blocks(exchange_path)
-    shells_all = group_exchange_shells(blocks, j_tol=j_tol, d_tol=d_tol, dist_tol=dist_tol)
+    table = model.bonds
+    atom_index = [label_to_index.get(label) for label in table.labels]
+
+    if isinstance(table, SpilledBonds):
+        _check_spilled(exchange_format, symprec, grouped_shells)
+        _write_spilled_shells(out, table, atom_index, spin_values, j_tol, d_tol, dist_tol,
+                              max_dist, min_exchange, use_dmi, profiler)
+        return
+
+    shells = selected_shells
+    if shells is None:
+        shells = select_exchange_shells(model, mag_threshold=mag_threshold,
+                                        j_tol=j_tol, d_tol=d_tol, dist_tol=dist_tol,
+                                        max_dist=max_dist, min_exchange=min_exchange,
+                                        use_dmi=use_dmi, symprec=symprec, profiler=profiler,
+                                        grouped_shells=grouped_shells)
+
+    with profiler.stage("emit"):
+        emitted = _write_shells(out, shells, table, atom_index, spin_values,
+                                use_dmi, min_exchange, exchange_format)
+        profiler.count("bonds_emitted", emitted)
+
+def check_exchange_format(exchange_format: str) -> None:
+    if exchange_format not in EXCHANGE_FORMATS:
+        raise ValueError(
+            f"未知的交换输出格式: {exchange_format}. 允许的值: {', '.join(EXCHANGE_FORMATS)}."
+        )
+
+def select_exchange_shells(model: ExchangeOut,
+                           mag_threshold: float = 0.5,
+                           j_tol: float = 1e-3,
+                           d_tol: float = 1e-3,
+                           dist_tol: float = 1e-3,
+                           max_dist: float = 0.0,
+                           min_exchange: float = 1e-3,
+                           use_dmi: bool = True,
+                           symprec: Optional[float] = None,
+                           profiler: Optional[Profiler] = None,
+                           grouped_shells: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    # 分组、过滤与对称约化 (含一致性检查), 返回要写出的壳层; 与写出分开, 以便在写出任何内容之前报错
+    profiler = get_profiler(profiler)
+    table = model.bonds
+    if isinstance(table, SpilledBonds):
+        _check_spilled("bonds", symprec, grouped_shells)
+
+    with profiler.stage("group_shells"):
+        shells_all = grouped_shells
+        if shells_all is None:
+            shells_all = group_exchange_shells(table, j_tol=j_tol, d_tol=d_tol, dist_tol=dist_tol)
+        profiler.count("shells", len(shells_all))
+        profiler.count("types", sum(len(shell['types']) for shell in shells_all))
+
+    with profiler.stage("filter"):
+        shells = []
+        for shell in shells_all:
+            if max_dist > 0.0 and shell['distance'] > max_dist:
+                continue
+            # 复制类型字典: 写出时会写入变量名, 对称约化会替换 rows
+            types = [dict(t) for t in shell['types']
+                     if not (abs(t['J']) <= min_exchange and abs(t['D']) <= min_exchange)]
+            if types:
+                shells.append({'distance': shell['distance'], 'types': types})
+        kept = _count_rows(shells)
+        profiler.count("shells", len(shells))
+        profiler.count("types", sum(len(shell['types']) for shell in shells))
+        profiler.count("bonds_filtered", len(table) - kept)
+
+    if symprec is not None:
+        with profiler.stage("symmetry"):
+            atoms = model.magnetic_atoms(mag_threshold, is_soc=use_dmi)
+            reduce_symmetric_bonds(shells, table, atoms, model.cell,
+                                   j_tol=j_tol, d_tol=d_tol, use_dmi=use_dmi, symprec=symprec)
+            profiler.count("bonds_removed", kept - _count_rows(shells))
+    return shells
+
+def _check_spilled(exchange_format: str,
+                   symprec: Optional[float],
+                   grouped_shells: Optional[List[Dict[str, Any]]]) -> None:
+    if exchange_format != "bonds" or symprec is not None or grouped_shells is not None:
+        raise ValueError("外部排序 (--memory-budget) 只支持 bonds 格式, 不能与对称约化或参数扫描同时使用。")
 
-    shells = []
-    for shell in shells_all:
-        if max_dist > 0.0 and shell['distance'] > max_dist:
-            continue
-        types = [t for t in shell['types']
-                 if not (abs(t['J']) <= min_exchange and abs(t['D']) <= min_exchange)]
-        if types:
-            shells.append({'distance': shell['distance'], 'types': types})
+def _count_rows(shells: List[Dict[str, Any]]) -> int:
+    return sum(len(t['rows']) for shell in shells for t in shell['types'])
 
-    out = []
-    out.append("# Exchange shells (J in meV, D = |DMI| in meV)")
+def _write_spilled_shells(out: LineWriter,
+                          table: SpilledBonds,
+                          atom_index: List[Optional[int]],
+                          spin_values: List[float],
+                          j_tol: float,
+                          d_tol: float,
+                          dist_tol: float,
+                          max_dist: float,
+                          min_exchange: float,
+                          use_dmi: bool,
+                          profiler: Profiler) -> None:
+    # 与内存路径输出相同, 但键只以有序流的形式出现: 第一遍归并得到壳层/类型摘要并写出变量定义,
+    # 第二遍重新归并, 按同样的规则划分后逐壳层写出 set_exchange!. 壳层内第一个类型直接写出,
+    # 其余类型的行暂存 (超出内存预算时转存到磁盘), 壳层结束时按类型顺序接在后面
+    with profiler.stage("group_shells"):
+        summary = summarize_shells(table.merged(), j_tol, d_tol, dist_tol, max_dist)
+        profiler.count("shells", len(summary))
+        profiler.count("types", sum(len(shell['types']) for shell in summary))
+        profiler.count("runs", table.runs)
+
+    with profiler.stage("filter"):
+        shells = []
+        kept_types: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        for n, shell in enumerate(summary):
+            types = []
+            for k, t in enumerate(shell['types']):
+                if not (abs(t['J']) <= min_exchange and abs(t['D']) <= min_exchange):
+                    types.append(t)
+                    kept_types[(n, k)] = t
+            if types:
+                shell['types'] = types
+                shells.append(shell)
+        kept = sum(t['count'] for t in kept_types.values())
+        profiler.count("shells", len(shells))
+        profiler.count("types", len(kept_types))
+        profiler.count("bonds_filtered", len(table) - kept)
+
+    with profiler.stage("emit"):
+        _write_coupling_names(out, shells, use_dmi)
+        out.line("# Exchange couplings")
+        max_lines = table.memory_budget // BYTES_PER_RECORD
+        emitted = 0
+        current = None
+        spools: Dict[int, LineSpool] = {}
+
+        def flush() -> None:
+            for k in sorted(spools):
+                for line in spools[k]:
+                    out.line(line)
+                spools[k].close()
+            spools.clear()
+            out.line("")
+
+        n = 0
+        for shell, dist, k, rec in stream_shell_types(table.merged(), j_tol, d_tol, dist_tol, max_dist):
+            t = kept_types.get((shell, k))
+            if t is None:
+                continue
+            if shell != current:
+                if current is not None:
+                    flush()
+                current = shell
+                n += 1
+                first = t
+                out.line(f"# --- Shell {n}: distance ≈ {dist:.3f} Å ---")
+            i = atom_index[rec[2]]
+            j = atom_index[rec[3]]
+            if i is None or j is None:
+                continue
+            line = _exchange_line(*_bond_fields(t, i, j, spin_values, use_dmi, min_exchange,
+                                                rec[9:12], rec[4:7]))
+            if t is first:
+                out.line(line)
+            else:
+                spool = spools.get(k)
+                if spool is None:
+                    # 预算由本壳层中需要暂存的类型平分
+                    share = max_lines // max(1, len(summary[shell]['types']) - 1)
+                    spool = spools[k] = LineSpool(share, table.spill_dir)
+                spool.append(line)
+            emitted += 1
+        if current is not None:
+            flush()
+        profiler.count("bonds_emitted", emitted)
+
+def _write_shells(out: LineWriter,
+                  shells: List[Dict[str, Any]],
+                  table,
+                  atom_index: List[Optional[int]],
+                  spin_values: List[float],
+                  use_dmi: bool,
+                  min_exchange: float,
+                  exchange_format: str) -> int:
+    _write_coupling_names(out, shells, use_dmi)
+
+    if exchange_format == "arrays":
+        return _write_coupling_arrays(out, shells, table, atom_index, spin_values,
+                                      use_dmi, min_exchange)
+
+    emitted = 0
+    out.line("# Exchange couplings")
+    for n, shell in enumerate(shells, 1):
+        out.line(f"# --- Shell {n}: distance ≈ {shell['distance']:.3f} Å ---")
+        for fields in _shell_bonds(shell, table, atom_index, spin_values, use_dmi, min_exchange):
+            out.line(_exchange_line(*fields))
+            emitted += 1
+        out.line("")
+    return emitted
+
+def _write_coupling_names(out: LineWriter, shells: List[Dict[str, Any]], use_dmi: bool) -> None:
+    # 给每个类型起变量名 (写入 _j_name/_d_name) 并写出 J/D 的定义
+    out.line("# Exchange shells (J in meV, D = |DMI| in meV)")
 
     for n, shell in enumerate(shells, 1):
         if len(shell['types']) == 1:
             t = shell['types'][0]
             t["_j_name"] = f"J{n}"
             t["_d_name"] = f"D{n}"
-            out.append(f"{t['_j_name']} = {t['J']:.6f}")
+            out.line(f"{t['_j_name']} = {t['J']:.6f}")
             if use_dmi:
-                out.append(f"{t['_d_name']} = {t['D']:.6f}")
+                out.line(f"{t['_d_name']} = {t['D']:.6f}")
         else:
             for k, t in enumerate(shell['types']):
                 suf = string.ascii_uppercase[k]
                 t["_j_name"] = f"J{n}_{suf}"
                 t["_d_name"] = f"D{n}_{suf}"
-                out.append(f"{t['_j_name']} = {t['J']:.6f}")
+                out.line(f"{t['_j_name']} = {t['J']:.6f}")
                 if use_dmi:
-                    out.append(f"{t['_d_name']} = {t['D']:.6f}")
-        out.append("")
+                    out.line(f"{t['_d_name']} = {t['D']:.6f}")
+        out.line("")
+
+def _exchange_line(t: Dict[str, Any], i: int, j: int, scale: float, with_dmi: bool,
+                   u: Tuple[float, float, float], R: Tuple[int, int, int]) -> str:
+    ux, uy, uz = u
+    Rx, Ry, Rz = R
+    if with_dmi:
+        term = f"{scale:.6f} * {t['_j_name']} * I"
+        term += (
+            f" + {scale:.6f} * {t['_d_name']} * dmvec([{ux:.6f}, {uy:.6f}, {uz:.6f}])"
+        )
+    else:
+        term = f"{scale:.6f} * {t['_j_name']}"
+    return f"set_exchange!(sys, {term}, Bond({i}, {j}, [{Rx}, {Ry}, {Rz}]))"
 
-    out.append("# Exchange couplings")
+def _shell_bonds(shell: Dict[str, Any],
+                 table,
+                 atom_index: List[Optional[int]],
+                 spin_values: List[float],
+                 use_dmi: bool,
+                 min_exchange: float) -> Iterator[Tuple]:
+    for t in shell['types']:
+        for k in t['rows']:
+            i = atom_index[table.i[k]]
+            j = atom_index[table.j[k]]
+            if i is None or j is None:
+                continue
+            yield _bond_fields(t, i, j, spin_values, use_dmi, min_exchange,
+                               table.DMI[3*k:3*k + 3], tuple(table.R[3*k:3*k + 3]))
+
+def _bond_fields(t: Dict[str, Any], i: int, j: int, spin_values: List[float], use_dmi: bool,
+                 min_exchange: float, dmi, R: Tuple[int, int, int]) -> Tuple:
+    D = t['D']
+    scale = 1.0 / math.sqrt(spin_values[i - 1] * spin_values[j - 1])
+    Dx, Dy, Dz = dmi
+    if use_dmi and D > 0:
+        u = (Dx/D, Dy/D, Dz/D)
+    else:
+        u = (0.0, 0.0, 0.0)
+    return t, i, j, scale, use_dmi and D > min_exchange, u, R
+
+def _write_coupling_arrays(out: LineWriter,
+                           shells: List[Dict[str, Any]],
+                           table,
+                           atom_index: List[Optional[int]],
+                           spin_values: List[float],
+                           use_dmi: bool,
+                           min_exchange: float) -> int:
+    # 每个键一行 set_exchange! 会让 Julia 解析/编译巨大的顶层脚本; 这里把键数据写成数组, 用一个循环设置.
+    # 缩放因子只取决于 (i, j), 是否带 DMI 只取决于类型, 因此都不按键重复写出
+    cols = {name: array("q") for name in ("i", "j", "Rx", "Ry", "Rz", "c")}
+    ucols = {name: array("d") for name in ("ux", "uy", "uz")}
+    couplings = []
+    ranges = []
     for n, shell in enumerate(shells, 1):
-        out.append(f"# --- Shell {n}: distance ≈ {shell['distance']:.3f} Å ---")
+        first = len(cols["i"]) + 1
         for t in shell['types']:
-            J = t['J']; D = t['D']
-            for b in t['bonds']:
-                i = label_to_index.get(b['i_label'])
-                j = label_to_index.get(b['j_label'])
-                if i is None or j is None:
-                    continue
-                scale = 1.0 / math.sqrt(spin_values[i - 1] * spin_values[j - 1])
-                Dx, Dy, Dz = b['DMI']
-                if use_dmi and D > 0:
-                    ux, uy, uz = Dx/D, Dy/D, Dz/D
-                else:
-                    ux, uy, uz = 0.0, 0.0, 0.0
-                if use_dmi and D > min_exchange:
-                    term = f"{scale:.6f} * {t['_j_name']} * I"
-                    term += (
-                        f" + {scale:.6f} * {t['_d_name']} * dmvec([{ux:.6f}, {uy:.6f}, {uz:.6f}])"
-                    )
-                else:
-                    term = f"{scale:.6f} * {t['_j_name']}"
-                out.append(
-                    f"set_exchange!(sys, {term}, Bond({i}, {j}, [{b['R'][0]}, {b['R'][1]}, {b['R'][2]}]))"
-                )
-        out.append("")
-    return "\n".join(out)
+            couplings.append(t)
+            t["_c"] = len(couplings)
+        for t, i, j, scale, with_dmi, (ux, uy, uz), (Rx, Ry, Rz) in _shell_bonds(
+                shell, table, atom_index, spin_values, use_dmi, min_exchange):
+            cols["i"].append(i); cols["j"].append(j)
+            cols["Rx"].append(Rx); cols["Ry"].append(Ry); cols["Rz"].append(Rz)
+            cols["c"].append(t["_c"])
+            ucols["ux"].append(ux); ucols["uy"].append(uy); ucols["uz"].append(uz)
+        last = len(cols["i"])
+        ranges.append((n, shell['distance'], f"bonds {first}:{last}" if last >= first else "no bonds"))
+
+    out.line("# Exchange couplings (compact form)")
+    for n, dist, span in ranges:
+        out.line(f"# --- Shell {n}: distance ≈ {dist:.3f} Å, {span} ---")
+    out.line("")
+    _write_array(out, "coupling_J", "Float64", [t['_j_name'] for t in couplings])
+    if use_dmi:
+        _write_array(out, "coupling_D", "Float64", [t['_d_name'] for t in couplings])
+        _write_array(out, "coupling_dmi", "Bool",
+                     ["true" if t['D'] > min_exchange else "false" for t in couplings])
+    out.line("pair_scale = [")
+    for si in spin_values:
+        row = ", ".join(f"{1.0 / math.sqrt(si * sj):.6f}" for sj in spin_values)
+        out.line(f"    [{row}],")
+    out.line("]")
+    _write_array(out, "bond_i", "Int", map(str, cols["i"]))
+    _write_array(out, "bond_j", "Int", map(str, cols["j"]))
+    for axis in ("Rx", "Ry", "Rz"):
+        _write_array(out, f"bond_{axis}", "Int", map(str, cols[axis]))
+    _write_array(out, "bond_coupling", "Int", map(str, cols["c"]))
+    if use_dmi:
+        for axis in ("ux", "uy", "uz"):
+            _write_array(out, f"bond_{axis}", "Float64", (f"{x:.6f}" for x in ucols[axis]))
+    out.line("")
+    out.line("for n in eachindex(bond_i)")
+    out.line("    i = bond_i[n]; j = bond_j[n]; c = bond_coupling[n]")
+    out.line("    s = pair_scale[i][j]")
+    if use_dmi:
+        out.line("    if coupling_dmi[c]")
+        out.line("        ex = s * coupling_J[c] * I + s * coupling_D[c] * dmvec([bond_ux[n], bond_uy[n], bond_uz[n]])")
+        out.line("    else")
+        out.line("        ex = s * coupling_J[c]")
+        out.line("    end")
+    else:
+        out.line("    ex = s * coupling_J[c]")
+    out.line("    set_exchange!(sys, ex, Bond(i, j, [bond_Rx[n], bond_Ry[n], bond_Rz[n]]))")
+    out.line("end")
+    out.line("")
+    return len(cols["i"])
+
+def _write_array(out: LineWriter, name: str, eltype: str, items) -> None:
+    prefix = f"{name} = {eltype}["
+    row: List[str] = []
+    pending = None
+    for item in items:
+        row.append(item)
+        if len(row) == ARRAY_ITEMS_PER_LINE:
+            if pending is not None:
+                out.line(prefix + pending + ",")
+                prefix = "    "
+            pending = ", ".join(row)
+            row = []
+    if pending is not None and row:
+        out.line(prefix + pending + ",")
+        prefix = "    "
+        pending = None
+    out.line(prefix + (pending if pending is not None else ", ".join(row)) + "]")
@@ -1,9 +1,14 @@
-from ..core.lattice_reader import read_lattice_vectors, cell_params_from_vectors
+from ..core.exchange_out import ExchangeOut
+from ..core.lattice_reader import cell_params_from_vectors
+from .writer import LineWriter, render_block
 
-def make_sunny_latvecs_block(exchange_path: str) -> str:
-    a_vec, b_vec, c_vec, _ = read_lattice_vectors(exchange_path)
+def make_sunny_latvecs_block(model: ExchangeOut) -> str:
+    return render_block(write_sunny_latvecs_block, model)
+
+def write_sunny_latvecs_block(model: ExchangeOut, out: LineWriter) -> None:
+    a_vec, b_vec, c_vec = model.cell
     a, b, c, alpha, beta, gamma = cell_params_from_vectors(a_vec, b_vec, c_vec)
-    return "\n".join([
+    out.lines([
         "# Lattice",
         "latvecs = lattice_vectors("
         f"{a:.8f}, {b:.8f}, {c:.8f}, {alpha:.6f}, {beta:.6f}, {gamma:.6f})"
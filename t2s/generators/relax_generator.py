@@ -1,5 +1,10 @@
+from .writer import LineWriter, render_block
+
 def make_relax_block() -> str:
-    return "\n".join([
+    return render_block(write_relax_block)
+
+def write_relax_block(out: LineWriter) -> None:
+    out.lines([
         "# Optional: randomize spins and relax to (meta-)stable state",
         "randomize_spins!(sys)",
         "minimize_energy!(sys)",
@@ -0,0 +1,68 @@
+import io, os, shutil, tempfile
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, TextIO
+
+OUTPUT_BUFFER = 1 << 20
+
+class LineWriter:
+    # 与 "\n".join(lines) 逐字节一致: 除第一行外, 每行之前写一个换行符
+    def __init__(self, fh: TextIO):
+        self.fh = fh
+        self._first = True
+
+    def line(self, text: str = "") -> None:
+        if self._first:
+            self._first = False
+        else:
+            self.fh.write("\n")
+        self.fh.write(text)
+
+    def lines(self, texts: Iterable[str]) -> None:
+        for text in texts:
+            self.line(text)
+
+    def raw(self, text: str) -> None:
+        # 原样写入之前用同一个 LineWriter 生成的片段 (除开头外已带换行分隔)
+        if text:
+            self._first = False
+            self.fh.write(text)
+
+def render_block(write: Callable[..., None], *args, **kwargs) -> str:
+    buf = io.StringIO()
+    write(*args, LineWriter(buf), **kwargs)
+    return buf.getvalue()
+
+@contextmanager
+def open_output(path: str, atomic: bool = True, buffering: int = OUTPUT_BUFFER) -> Iterator[TextIO]:
+    if not atomic:
+        with open(path, "w", encoding="utf-8", buffering=buffering) as fh:
+            yield fh
+        return
+    # 写入同目录下的临时文件, 成功后再 rename 覆盖目标; 出错时目标文件保持不变
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", buffering=buffering) as fh:
+            yield fh
+        if os.path.exists(path):
+            os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp, 0o666 & ~umask)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+@contextmanager
+def deferred_output(stream: TextIO, max_size: int = 16 * OUTPUT_BUFFER) -> Iterator[TextIO]:
+    # 标准输出无法原子替换: 先写入临时缓冲 (超过 max_size 后转存到磁盘), 成功后再整体复制到 stream;
+    # 出错时 stream 上什么也不写
+    with tempfile.SpooledTemporaryFile(max_size=max_size, mode="w+", encoding="utf-8") as fh:
+        yield fh
+        fh.seek(0)
+        shutil.copyfileobj(fh, stream)
@@ -0,0 +1,112 @@
+import hashlib, io, json, os
+from typing import Any, Dict, List, Optional
+from .builder import sunny_sections
+from .core.exchange_out import ExchangeOut
+from .generators.writer import LineWriter, open_output
+from .profiling import Profiler, get_profiler
+
+# 段的生成规则或清单格式变化时递增, 旧清单整体失效
+MANIFEST_FORMAT = 1
+
+def manifest_path(output_path: str) -> str:
+    directory, name = os.path.split(os.path.abspath(output_path))
+    return os.path.join(directory, f".{name}.t2s.json")
+
+def model_digests(model: ExchangeOut) -> Dict[str, str]:
+    cell = repr(model.cell).encode()
+    atoms = hashlib.sha256(cell)
+    for line in model.atom_lines:
+        atoms.update(line.encode("utf-8"))
+    table = model.bonds
+    bonds = hashlib.sha256("\0".join(table.labels).encode("utf-8"))
+    for column in (table.i, table.j, table.R, table.disp, table.distance,
+                   table.J_iso, table.J_inline, table.DMI):
+        bonds.update(column.tobytes())
+    return {
+        "cell": hashlib.sha256(cell).hexdigest(),
+        "atoms": atoms.hexdigest(),
+        "bonds": bonds.hexdigest(),
+    }
+
+def section_key(name: str, inputs: Dict[str, Any], digests: Dict[str, str]) -> str:
+    inputs = dict(inputs)
+    inputs["model"] = [digests[part] for part in inputs.get("model", ())]
+    payload = json.dumps([MANIFEST_FORMAT, name, inputs], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def read_manifest(output_path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(manifest_path(output_path), encoding="utf-8") as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get("format") != MANIFEST_FORMAT:
+        return None
+    return manifest
+
+def _previous_output(output_path: str, manifest: Optional[Dict[str, Any]]) -> Optional[str]:
+    # 输出文件被删除或手动改过 (哈希与清单不符) 时, 旧的段一律不复用
+    if manifest is None:
+        return None
+    try:
+        with open(output_path, "rb") as fh:
+            data = fh.read()
+    except OSError:
+        return None
+    if hashlib.sha256(data).hexdigest() != manifest.get("sha256"):
+        return None
+    return data.decode("utf-8")
+
+def write_sunny_julia_incremental(model: ExchangeOut,
+                                  output_path: str,
+                                  atomic: bool = True,
+                                  profiler: Optional[Profiler] = None,
+                                  **options) -> List[str]:
+    # 每段以其输入的哈希为键, 只重算键变化的段; 结果与旧文件相同时不写文件 (mtime 不变).
+    # 返回内容发生变化的段名
+    profiler = get_profiler(profiler)
+    manifest = read_manifest(output_path)
+    previous = _previous_output(output_path, manifest)
+    old = {}
+    if previous is not None:
+        old = {s["name"]: s for s in manifest.get("sections", ())}
+
+    with profiler.stage("write"):
+        sections = sunny_sections(model, profiler=profiler, **options)
+        digests = model_digests(model)
+        keys = [(name, section_key(name, inputs, digests)) for name, inputs, _ in sections]
+        if previous is not None and [(s["name"], s["key"]) for s in manifest["sections"]] == keys:
+            return []
+
+        buf = io.StringIO()
+        out = LineWriter(buf)
+        records = []
+        for (name, inputs, write), (_, key) in zip(sections, keys):
+            start = buf.tell()
+            entry = old.get(name)
+            if entry is not None and entry["key"] == key:
+                out.raw(previous[entry["start"]:entry["end"]])
+            else:
+                write(out)
+                profiler.count("regenerated", 1)
+            records.append({"name": name, "key": key, "start": start, "end": buf.tell()})
+        text = buf.getvalue()
+
+    changed = []
+    if text != previous:
+        with open_output(output_path, atomic=atomic) as fh:
+            fh.write(text)
+        for s in records:
+            entry = old.get(s["name"])
+            if entry is None or text[s["start"]:s["end"]] != previous[entry["start"]:entry["end"]]:
+                changed.append(s["name"])
+        changed += [name for name in old if name not in {s["name"] for s in records}]
+    new_manifest = {
+        "format": MANIFEST_FORMAT,
+        "sha256": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+        "sections": records,
+    }
+    with open_output(manifest_path(output_path)) as fh:
+        json.dump(new_manifest, fh, indent=2)
+        fh.write("\n")
+    return changed
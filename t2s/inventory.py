@@ -0,0 +1,56 @@
+import csv, json, os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, TextIO, Tuple
+from .core.probe import probe_exchange_out
+
+INVENTORY_FORMATS = ("csv", "json")
+CSV_FIELDS = ("path", "compression", "bytes", "a", "b", "c", "alpha", "beta", "gamma", "soc",
+              "atoms", "magnetic", "labels", "moments", "bonds", "max_distance", "error")
+
+def _probe_one(job: Tuple[str, float, bool]) -> Dict[str, Any]:
+    src, mag_threshold, count_bonds = job
+    try:
+        info = probe_exchange_out(src, mag_threshold=mag_threshold, count_bonds=count_bonds)
+    except Exception as exc:
+        return {"path": src, "error": f"{type(exc).__name__}: {exc}"}
+    info["error"] = None
+    return info
+
+def probe_many(inputs: List[Path],
+               mag_threshold: float = 0.5,
+               count_bonds: bool = False,
+               workers: Optional[int] = None) -> Iterable[Dict[str, Any]]:
+    # 按输入顺序产出每个文件的探测结果; 出错的文件只带 path 和 error
+    jobs = [(str(src), mag_threshold, count_bonds) for src in inputs]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs)))
+    if workers == 1:
+        for job in jobs:
+            yield _probe_one(job)
+        return
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_probe_one, jobs, chunksize=chunksize)
+
+def csv_row(info: Dict[str, Any]) -> Dict[str, Any]:
+    row = {name: info.get(name) for name in CSV_FIELDS}
+    magnetic = info.get("magnetic_atoms")
+    if magnetic is not None:
+        row["magnetic"] = len(magnetic)
+        row["labels"] = ";".join(atom["label"] for atom in magnetic)
+        row["moments"] = ";".join(f"{atom['moment']:.4f}" for atom in magnetic)
+    return {name: "" if value is None else value for name, value in row.items()}
+
+def write_inventory(rows: Iterable[Dict[str, Any]], fh: TextIO, fmt: str = "csv") -> None:
+    if fmt not in INVENTORY_FORMATS:
+        raise ValueError(f"未知的清单格式: {fmt}. 允许的值: {', '.join(INVENTORY_FORMATS)}.")
+    if fmt == "json":
+        json.dump(list(rows), fh, indent=2, ensure_ascii=False)
+        fh.write("\n")
+        return
+    writer = csv.DictWriter(fh, fieldnames=CSV_FIELDS, lineterminator="\n")
+    writer.writeheader()
+    for info in rows:
+        writer.writerow(csv_row(info))
@@ -0,0 +1,111 @@
+import json, time, tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+
+class Profiler:
+    # 记录每个阶段的耗时、tracemalloc 峰值 (相对进入阶段时的已分配量) 以及计数; 阶段可以嵌套
+    def __init__(self, memory: bool = True):
+        self.memory = memory
+        self.stages: List[Dict[str, Any]] = []
+        self._stack: List[Dict[str, Any]] = []
+        self._tracing = False
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, Any]]:
+        record = {"name": name, "depth": len(self._stack), "seconds": 0.0,
+                  "peak_bytes": None, "counts": {}}
+        self.stages.append(record)
+        if self.memory and not self._stack and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        frame = {"record": record, "start": 0, "peak": 0}
+        if self.memory:
+            current = self._update_peaks()
+            frame["start"] = frame["peak"] = current
+        self._stack.append(frame)
+        t0 = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - t0
+            if self.memory:
+                self._update_peaks()
+            self._stack.pop()
+            if self.memory:
+                record["peak_bytes"] = frame["peak"] - frame["start"]
+                if not self._stack and self._tracing:
+                    tracemalloc.stop()
+                    self._tracing = False
+
+    def _update_peaks(self) -> int:
+        # 峰值计数器是全局的: 读出后分摊给所有活动阶段再清零, 嵌套阶段互不干扰
+        current, peak = tracemalloc.get_traced_memory()
+        for frame in self._stack:
+            frame["peak"] = max(frame["peak"], peak)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        return current
+
+    def count(self, key: str, n: Any = 1) -> None:
+        if self._stack:
+            _add(self._stack[-1]["record"]["counts"], key, n)
+
+    def count_lines(self, lines: Iterable[str], key: str = "lines") -> Iterator[str]:
+        # 计数记在开始迭代时所在的阶段, 即使迭代器在嵌套阶段中才被耗尽
+        counts = self._stack[-1]["record"]["counts"] if self._stack else {}
+        n = 0
+        size = 0
+        try:
+            for line in lines:
+                n += 1
+                size += len(line)
+                yield line
+        finally:
+            _add(counts, key, n)
+            _add(counts, "chars", size)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "total_seconds": sum(s["seconds"] for s in self.stages if s["depth"] == 0),
+            "stages": self.stages,
+        }
+
+    def write_json(self, fh: TextIO) -> None:
+        json.dump(self.report(), fh, indent=2, ensure_ascii=False)
+        fh.write("\n")
+
+    def format_table(self) -> str:
+        rows = [("stage", "time (s)", "peak (MB)", "counts")]
+        for s in self.stages:
+            peak = "" if s["peak_bytes"] is None else f"{s['peak_bytes'] / 2**20:.2f}"
+            counts = ", ".join(f"{k}={v}" for k, v in s["counts"].items())
+            rows.append(("  " * s["depth"] + s["name"], f"{s['seconds']:.4f}", peak, counts))
+        widths = [max(len(r[k]) for r in rows) for k in range(3)]
+        lines = [f"{r[0]:<{widths[0]}}  {r[1]:>{widths[1]}}  {r[2]:>{widths[2]}}  {r[3]}".rstrip()
+                 for r in rows]
+        lines.insert(1, "-" * max(len(line) for line in lines))
+        return "\n".join(lines)
+
+def _add(counts: Dict[str, Any], key: str, n: Any) -> None:
+    if isinstance(n, bool) or not isinstance(n, (int, float)):
+        counts[key] = n
+    else:
+        counts[key] = counts.get(key, 0) + n
+
+class NullProfiler:
+    # 未开启 --profile 时使用: 所有方法都是空操作, 不包装行迭代器
+    _context = nullcontext()
+
+    def stage(self, name: str):
+        return self._context
+
+    def count(self, key: str, n: Any = 1) -> None:
+        pass
+
+    def count_lines(self, lines: Iterable[str], key: str = "lines") -> Iterable[str]:
+        return lines
+
+NULL_PROFILER = NullProfiler()
+
+def get_profiler(profiler: Optional[Profiler]):
+    return NULL_PROFILER if profiler is None else profiler
@@ -0,0 +1,143 @@
+import io, json, os, threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib import error as urlerror, request as urlrequest
+from .builder import load_model, write_sunny_julia
+from .core.cache import ParseCache
+from .generators.atom_generator import check_spin_value
+from .generators.writer import LineWriter
+from .sweep import ShellMemo
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_MODELS = 16
+# 每个模型保留的壳层分组数 (不同的 dist_tol/j_tol/d_tol 组合)
+SHELL_MEMO_SIZE = 8
+# 客户端可以传递的 write_sunny_julia 参数
+SERVE_OPTIONS = ("soc_mode", "mag_threshold", "j_tol", "d_tol", "dist_tol", "max_dist",
+                 "min_exchange", "with_dipole", "with_relax", "spins", "exchange_format",
+                 "symmetry_reduce", "symprec")
+
+class ModelCache:
+    # 解析后的模型按绝对路径做 LRU 缓存; 每次访问先 stat, (大小, mtime) 变化即重新解析
+    def __init__(self, max_models: int = DEFAULT_MAX_MODELS, parse_cache: Optional[ParseCache] = None):
+        self.max_models = max_models
+        self.parse_cache = parse_cache
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int], ShellMemo]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, exchange_path: str) -> ShellMemo:
+        path = os.path.abspath(exchange_path)
+        st = os.stat(path)
+        signature = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        memo = ShellMemo(load_model(path, self.parse_cache), max_entries=SHELL_MEMO_SIZE)
+        with self._lock:
+            self._entries[path] = (signature, memo)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_models:
+                self._entries.popitem(last=False)
+        return memo
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"models": list(self._entries), "hits": self.hits, "misses": self.misses}
+
+def render_request(models: ModelCache, payload: Dict[str, Any]) -> str:
+    # 请求体来自网络, 检查与命令行相同: 格式不对或取值不允许时抛 ValueError (返回 400)
+    if not isinstance(payload, dict):
+        raise ValueError("请求体必须是 JSON 对象。")
+    exchange_path = payload.get("exchange")
+    if not isinstance(exchange_path, str):
+        raise ValueError("请求缺少 exchange 路径。")
+    options = payload.get("options") or {}
+    if not isinstance(options, dict):
+        raise ValueError("options 必须是 JSON 对象。")
+    unknown = set(options) - set(SERVE_OPTIONS)
+    if unknown:
+        raise ValueError(f"未知的参数: {', '.join(sorted(unknown))}.")
+    spins = options.get("spins")
+    if spins is not None:
+        if not isinstance(spins, list):
+            raise ValueError("spins 必须是 S 值的列表。")
+        for value in spins:
+            check_spin_value(value)
+    memo = models.get(exchange_path)
+    shells = memo.shells(options.get("dist_tol", 1e-3), options.get("j_tol", 1e-3),
+                         options.get("d_tol", 1e-3))
+    buf = io.StringIO()
+    write_sunny_julia(memo.model, LineWriter(buf), grouped_shells=shells, **options)
+    return buf.getvalue()
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "t2s"
+    models: ModelCache = None
+    quiet = False
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, "text/plain; charset=utf-8", "ok")
+        elif self.path == "/stats":
+            self._send(200, "application/json", json.dumps(self.models.stats()))
+        else:
+            self._send(404, "text/plain; charset=utf-8", f"unknown endpoint: {self.path}")
+
+    def do_POST(self):
+        if self.path != "/build":
+            self._send(404, "text/plain; charset=utf-8", f"unknown endpoint: {self.path}")
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length).decode("utf-8"))
+            text = render_request(self.models, payload)
+        except FileNotFoundError as exc:
+            self._send(404, "text/plain; charset=utf-8", f"exchange.out not found: {exc.filename}")
+        except (ValueError, RuntimeError, TypeError) as exc:
+            self._send(400, "text/plain; charset=utf-8", str(exc))
+        except Exception as exc:
+            self._send(500, "text/plain; charset=utf-8", f"{type(exc).__name__}: {exc}")
+        else:
+            self._send(200, "text/plain; charset=utf-8", text)
+
+    def _send(self, status: int, content_type: str, body: str) -> None:
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+def make_server(host: str = DEFAULT_HOST,
+                port: int = DEFAULT_PORT,
+                models: Optional[ModelCache] = None,
+                quiet: bool = False) -> ThreadingHTTPServer:
+    handler = type("Handler", (_Handler,), {"models": models or ModelCache(), "quiet": quiet})
+    return ThreadingHTTPServer((host, port), handler)
+
+def request_build(server_url: str,
+                  exchange_path: str,
+                  options: Dict[str, Any],
+                  timeout: Optional[float] = None) -> str:
+    body = json.dumps({"exchange": os.path.abspath(exchange_path), "options": options}).encode("utf-8")
+    req = urlrequest.Request(server_url.rstrip("/") + "/build", data=body,
+                             headers={"Content-Type": "application/json"})
+    try:
+        with urlrequest.urlopen(req, timeout=timeout) as resp:
+            return resp.read().decode("utf-8")
+    except urlerror.HTTPError as exc:
+        raise ValueError(exc.read().decode("utf-8", errors="replace")) from None
+    except urlerror.URLError as exc:
+        raise RuntimeError(f"无法连接到 t2s serve ({server_url}): {exc.reason}") from None
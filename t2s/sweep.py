@@ -0,0 +1,151 @@
+import itertools, json, os, threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from .builder import load_model, parse_filter, write_sunny_julia
+from .core.cache import ParseCache
+from .core.exchange_out import ExchangeOut
+from .core.symmetry import cluster_shell_types, group_distance_shells
+from .generators.writer import LineWriter, open_output
+
+SWEEP_PARAMETERS = ("max_dist", "min_exchange", "j_tol", "dist_tol")
+SWEEP_INDEX = "sweep.json"
+
+def sweep_points(grid: Dict[str, Sequence[float]]) -> List[Dict[str, float]]:
+    unknown = set(grid) - set(SWEEP_PARAMETERS)
+    if unknown:
+        raise ValueError(
+            f"不支持扫描的参数: {', '.join(sorted(unknown))}. 允许的值: {', '.join(SWEEP_PARAMETERS)}."
+        )
+    names = [name for name in SWEEP_PARAMETERS if name in grid]
+    for name in names:
+        if not grid[name]:
+            raise ValueError(f"扫描参数 {name} 没有取值。")
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+def point_filename(point: Dict[str, float], prefix: str = "sunny", suffix: str = ".jl") -> str:
+    tags = {"max_dist": "maxdist", "min_exchange": "minex", "j_tol": "jtol", "dist_tol": "disttol"}
+    parts = [f"{tags[name]}{format_value(point[name])}" for name in SWEEP_PARAMETERS if name in point]
+    return "_".join([prefix] + parts) + suffix
+
+def format_value(value: float) -> str:
+    # 默认用 :g; 6 位有效数字不足以区分时改用 repr, 保证不同的取值得到不同的文件名
+    text = f"{value:g}"
+    return text if float(text) == value else repr(float(value))
+
+class ShellMemo:
+    # 按距离排序只做一次; 距离壳层按 dist_tol 复用, 类型聚类按 (dist_tol, j_tol, d_tol) 复用.
+    # max_entries 限制保留的分组数 (LRU), None 表示不限. 可以在多个线程间共享 (t2s serve)
+    def __init__(self, model: ExchangeOut, max_entries: Optional[int] = None):
+        self.model = model
+        self.max_entries = max_entries
+        self._order = None
+        self._distance: "OrderedDict[float, List[Dict[str, Any]]]" = OrderedDict()
+        self._typed: "OrderedDict[Tuple[float, float, float], List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def shells(self, dist_tol: float, j_tol: float, d_tol: float) -> List[Dict[str, Any]]:
+        # 整个查找与计算都持锁: 同一模型上的并发请求不会重复分组, 也不会在淘汰时互相干扰
+        with self._lock:
+            return self._shells(dist_tol, j_tol, d_tol)
+
+    def _shells(self, dist_tol: float, j_tol: float, d_tol: float) -> List[Dict[str, Any]]:
+        key = (dist_tol, j_tol, d_tol)
+        typed = self._typed.get(key)
+        if typed is None:
+            table = self.model.bonds
+            distance = self._distance.get(dist_tol)
+            if distance is None:
+                if self._order is None:
+                    self._order = table.distance_order()
+                distance = group_distance_shells(table, dist_tol=dist_tol, order=self._order)
+                self._remember(self._distance, dist_tol, distance)
+            typed = cluster_shell_types(distance, table, j_tol=j_tol, d_tol=d_tol)
+            self._remember(self._typed, key, typed)
+        else:
+            self._typed.move_to_end(key)
+        return typed
+
+    def _remember(self, memo: OrderedDict, key, value) -> None:
+        memo[key] = value
+        if self.max_entries is not None:
+            while len(memo) > self.max_entries:
+                memo.popitem(last=False)
+
+_worker_memo: Optional[ShellMemo] = None
+
+def _init_worker(model: ExchangeOut) -> None:
+    global _worker_memo
+    _worker_memo = ShellMemo(model)
+
+def _write_point(memo: ShellMemo,
+                 job: Tuple[Dict[str, float], str, Dict[str, Any]]) -> Tuple[Dict[str, float], str, Optional[str]]:
+    point, dst, options = job
+    options = dict(options, **point)
+    try:
+        shells = memo.shells(options.get("dist_tol", 1e-3),
+                             options.get("j_tol", 1e-3),
+                             options.get("d_tol", 1e-3))
+        atomic = options.pop("atomic", True)
+        with open_output(dst, atomic=atomic) as fh:
+            write_sunny_julia(memo.model, LineWriter(fh), grouped_shells=shells, **options)
+    except Exception as exc:
+        return point, dst, f"{type(exc).__name__}: {exc}"
+    return point, dst, None
+
+def _run_job(job):
+    return _write_point(_worker_memo, job)
+
+def run_sweep(exchange_path: str,
+              output_dir: str,
+              grid: Dict[str, Sequence[float]],
+              options: Dict[str, Any],
+              workers: Optional[int] = None,
+              cache: Optional[ParseCache] = None,
+              prefix: str = "sunny",
+              suffix: str = ".jl") -> Iterable[Tuple[Dict[str, float], str, Optional[str]]]:
+    # exchange.out 只解析一次; 各网格点在子进程中生成, 模型通过 initializer 每个进程只传一次
+    points = sweep_points(grid)
+    options = dict(options)
+    # 解析时的过滤取所有网格点中最宽松的值
+    max_dist = grid.get("max_dist", [options.get("max_dist", 0.0)])
+    where = parse_filter(0.0 if min(max_dist) <= 0.0 else max(max_dist),
+                         max(grid.get("dist_tol", [options.get("dist_tol", 1e-3)])),
+                         min(grid.get("min_exchange", [options.get("min_exchange", 1e-3)])),
+                         options.pop("prefilter", False), options.pop("pair_labels", None))
+    model = load_model(exchange_path, cache, where=where, workers=options.pop("parse_jobs", None))
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    jobs = [(point, os.path.join(output_dir, point_filename(point, prefix, suffix)), options)
+            for point in points]
+    seen: Dict[str, Dict[str, float]] = {}
+    for point, dst, _ in jobs:
+        if dst in seen:
+            raise ValueError(f"两个扫描点的输出文件名相同: {seen[dst]} 与 {point} -> {os.path.basename(dst)}")
+        seen[dst] = point
+    # 同一组 (dist_tol, j_tol) 的点排在一起, 使同一个块内的点共享壳层分组
+    jobs.sort(key=lambda job: (job[0].get("dist_tol", 0.0), job[0].get("j_tol", 0.0)))
+
+    _write_index(output_dir, exchange_path, jobs)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs)))
+    if workers == 1:
+        memo = ShellMemo(model)
+        for job in jobs:
+            yield _write_point(memo, job)
+        return
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model,)) as pool:
+        yield from pool.map(_run_job, jobs, chunksize=chunksize)
+
+def _write_index(output_dir: str, exchange_path: str, jobs) -> None:
+    index = {
+        "exchange": os.path.abspath(exchange_path),
+        "points": [dict(point, file=os.path.basename(dst)) for point, dst, _ in jobs],
+    }
+    with open_output(os.path.join(output_dir, SWEEP_INDEX)) as fh:
+        json.dump(index, fh, indent=2)
+        fh.write("\n")